@@ -3,10 +3,17 @@ Agent Logic Built From Scratch with Optimized Memory and a Tool-Calling Loop.
 The memory is now automatically summarized when the conversation gets too long.
 """
 
+import asyncio
 import os
+import json
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from dotenv import load_dotenv
-import tiktoken  # Added for accurate token counting
+import streamlit as st
 
 # LangChain imports for message types and the LLM
 from langchain_core.messages import (
@@ -15,118 +22,372 @@ from langchain_core.messages import (
     ToolMessage,
     SystemMessage,
     AnyMessage,
+    message_chunk_to_message,
 )
-from langchain_google_genai import ChatGoogleGenerativeAI
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+from tracing import span, start_span
 
 # Import calendar tools
-from calenderTool import get_events_between_start_and_end, set_calender_event, find_event_by_name, get_current_date_time , update_event, delete_event
+from calenderTool import get_events_between_start_and_end, set_calender_event, find_event_by_name, get_current_date_time , update_event, delete_event, get_free_availability, create_events, update_events, delete_events
 
 # Load environment variables
 load_dotenv()
 
 
+def _content_text(content) -> str:
+    """Extracts plain text from message content (a string or a list of content parts)."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and part.get("type") == "text":
+            parts.append(part.get("text", ""))
+    return "".join(parts)
+
+# Tools that change the calendar. These always run one at a time and in the
+# order the LLM requested them; every other tool is read-only and may run in parallel.
+WRITE_TOOLS = {"set_calender_event", "update_event", "delete_event", "create_events", "update_events", "delete_events"}
+
+# Shared pool for running independent read-only tool calls concurrently
+TOOL_EXECUTOR_MAX_WORKERS = 8
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_EXECUTOR_MAX_WORKERS, thread_name_prefix="tool")
+
+# Background summarization runs off the request path on its own small pool
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+
+@st.cache_resource
+def get_llm():
+    """The Gemini chat model, created once per process. The SDK is imported on first use."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model="gemini-2.5-flash")
+
+
+@st.cache_resource
+def get_tokenizer():
+    """The tiktoken encoding used for token counting, loaded once per process."""
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def _usage_attributes(message):
+    """Token usage reported by the LLM for one response, as span attributes."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return {key: usage[key] for key in ("input_tokens", "output_tokens") if key in usage}
+
+
+def _run_with_script_ctx(script_ctx, fn, *args):
+    """
+    Runs fn in a pooled worker thread attached to the caller's Streamlit session
+    (or to none), then puts back whatever the thread was attached to before, so
+    the next caller on this thread doesn't inherit another user's session.
+    """
+    thread = threading.current_thread()
+    previous = getattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+    if script_ctx is not None:
+        add_script_run_ctx(thread, script_ctx)
+    else:
+        setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+    try:
+        return fn(*args)
+    finally:
+        setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, previous)
+
+
 class SchedulingAgent:
     """
     A robust, stateful agent that manages conversation and tool use from scratch,
     now with intelligent memory summarization.
     """
 
-    def __init__(self, tools, system_prompt=""):
+    def __init__(self, tools, system_prompt="", llm=None, llm_with_tools=None, tokenizer=None):
         """
         Initializes the agent with its tools, system prompt, LLM, and memory logic.
+        A pre-built llm, llm_with_tools and tokenizer can be passed in so that many
+        agents share them instead of each creating their own.
         """
         self.system_prompt = SystemMessage(content=system_prompt)
         self.tools = {tool.name: tool for tool in tools}
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
-        self.llm_with_tools = self.llm.bind_tools(tools)
+        self.llm = llm or get_llm()
+        self.llm_with_tools = llm_with_tools or self.llm.bind_tools(tools)
         self.memory: List[AnyMessage] = []
+        # Serializes turns for the same agent (e.g. one user with two open tabs)
+        self.lock = threading.RLock()
 
         # --- New Memory Optimization Attributes ---
         # Using tiktoken for accurate token counting (standard for many LLMs)
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.tokenizer = tokenizer or get_tokenizer()
         self.summarization_threshold = 8000  # Trigger summarization after 8k tokens
+        self.summarization_watermark = 6000  # Start summarizing in the background after 6k tokens
         self.messages_to_retain = 10  # Keep the last 5 user/AI turns
+        self.summarization_max_input_tokens = 3000  # Cap on new conversation text per summarization
+        self.summarization_max_message_chars = 1500  # Long tool outputs are clipped before summarizing
+        self.max_fact_slots = 30  # Most recent events remembered in the structured slot store
+
+        # Token ledger: one entry per message in memory, computed once on append,
+        # plus a running total so the context size is known in O(1).
+        self._token_ledger: List[int] = []
+        self._memory_tokens = 0
+        self._system_prompt_tokens = self._count_message_tokens(self.system_prompt)
+
+        # Background summarization: (future, summarized messages) while one is running
+        self._pending_summary = None
+
+        # Rolling summary: the text so far and the SystemMessage holding it (memory[0])
+        self.summary_text = ""
+        self._summary_message = None
+        # Structured facts pulled from tool calls, keyed by event name
+        self.fact_slots = OrderedDict()
+
+    def _count_message_tokens(self, msg: AnyMessage) -> int:
+        """Returns the number of context tokens a single message occupies."""
+        usage = getattr(msg, "usage_metadata", None)
+        if isinstance(msg, AIMessage) and usage:
+            # output_tokens is exactly this message; thinking tokens are not resent
+            reasoning = (usage.get("output_token_details") or {}).get("reasoning", 0)
+            return max(usage.get("output_tokens", 0) - reasoning, 0)
+
+        text = _content_text(msg.content)
+        if isinstance(msg, AIMessage) and msg.tool_calls:
+            text += json.dumps([{"name": c["name"], "args": c["args"]} for c in msg.tool_calls])
+        return len(self.tokenizer.encode(text))
+
+    def _record_facts(self, msg: AnyMessage):
+        """Stores event names, times, attendees and locations from tool calls in fact_slots."""
+        if not isinstance(msg, AIMessage):
+            return
+        for tool_call in msg.tool_calls:
+            args = tool_call.get("args") or {}
+            # Batch tools carry a list of per-event args
+            batch = args.get("events") or args.get("changes") or [{"event_name": n} for n in args.get("event_names") or []]
+            for item in batch if isinstance(batch, list) else []:
+                self._record_fact(tool_call["name"], item)
+            self._record_fact(tool_call["name"], args)
+
+    def _record_fact(self, action, args):
+        """Updates the fact slot for the event named in one set of tool args, if any."""
+        name = isinstance(args, dict) and (args.get("summary") or args.get("event_name"))
+        if not name:
+            return
+        slot = self.fact_slots.pop(name, {})
+        slot["action"] = action
+        for field in ("start_time", "end_time", "new_start_time", "new_end_time", "location", "new_location", "new_summary"):
+            if args.get(field):
+                slot[field] = args[field]
+        if args.get("attendees"):
+            slot["attendees"] = [a.get("email", a) if isinstance(a, dict) else a for a in args["attendees"]]
+        self.fact_slots[name] = slot
+        while len(self.fact_slots) > self.max_fact_slots:
+            self.fact_slots.popitem(last=False)
+
+    def _append_memory(self, *messages: AnyMessage):
+        """Appends messages to memory and records their token counts in the ledger."""
+        for msg in messages:
+            self._record_facts(msg)
+            tokens = self._count_message_tokens(msg)
+            self.memory.append(msg)
+            self._token_ledger.append(tokens)
+            self._memory_tokens += tokens
+
+    def _replace_memory(self, messages: List[AnyMessage], ledger: List[int]):
+        """Swaps in a new memory together with its (already computed) ledger."""
+        self.memory = messages
+        self._token_ledger = ledger
+        self._memory_tokens = sum(ledger)
 
     def _get_token_count(self) -> int:
-        """Calculates the total token count of the current memory."""
-        try:
-            total_tokens = 0
-            for msg in self.memory:
-                if isinstance(msg, AIMessage):
-                    total_tokens += msg.usage_metadata['total_tokens']
-            return total_tokens
-        except Exception as e:
-            print(f"Error calculating token count: {e}")
-            full_text = " ".join([msg.content for msg in self.memory if isinstance(msg.content, str)])
-            return len(self.tokenizer.encode(full_text))
+        """Returns the size of the context sent to the LLM: system prompt plus memory."""
+        return self._system_prompt_tokens + self._memory_tokens
 
-    def _handle_memory(self):
+    def _safe_cut_index(self, cut: int) -> int:
         """
-        Checks the memory size and summarizes it if it exceeds the threshold.
-        This is the core of the new memory optimization logic.
+        Moves a memory cut point back so the retained part never starts with a
+        ToolMessage, i.e. an AIMessage with tool_calls stays with its results.
         """
-        token_count = self._get_token_count()
-        print(f"--- Current Token Count: {token_count} ---")
-
-        if token_count <= self.summarization_threshold:
-            # Memory is within limits, no action needed
-            return
+        cut = max(cut, 0)
+        while 0 < cut < len(self.memory) and isinstance(self.memory[cut], ToolMessage):
+            cut -= 1
+        return cut
 
-        print(f"--- Token count ({token_count}) exceeds threshold ({self.summarization_threshold}). Summarizing memory... ---")
+    def _render_summary_message(self, summary_text: str) -> SystemMessage:
+        """Builds the summary SystemMessage from the rolling summary and the fact slots."""
+        content = f"Summary of the conversation so far:\n{summary_text}"
+        if self.fact_slots:
+            lines = []
+            for name, slot in self.fact_slots.items():
+                details = ", ".join(f"{key}={value}" for key, value in slot.items())
+                lines.append(f"- {name}: {details}")
+            content += "\n\nKnown events:\n" + "\n".join(lines)
+        return SystemMessage(content=content)
 
-        # 1. Separate the messages to be summarized from those to be retained
-        messages_to_summarize = self.memory[:-self.messages_to_retain]
-        messages_to_keep = self.memory[-self.messages_to_retain:]
+    def _summarize(self, previous_summary: str, new_messages: List[AnyMessage]) -> str:
+        """
+        Folds newly evicted messages into the previous summary with the base LLM.
+        Only the new messages are sent, clipped to summarization_max_input_tokens.
+        """
+        lines = []
+        budget = self.summarization_max_input_tokens
+        # Walk newest to oldest so the most recent context survives the cap
+        for i, msg in enumerate(reversed(new_messages)):
+            text = _content_text(msg.content)[:self.summarization_max_message_chars]
+            line = f"{msg.__class__.__name__}: {text}"
+            cost = len(self.tokenizer.encode(line))
+            if cost > budget:
+                lines.append(f"({len(new_messages) - i} older messages omitted)")
+                break
+            lines.append(line)
+            budget -= cost
+        lines.reverse()
+        input_tokens = self.summarization_max_input_tokens - budget
 
-        # 2. Create the prompt for the summarization call
         summarization_prompt = (
-            "You are a helpful assistant. Summarize the key facts, entities, and user decisions "
-            "from this conversation history. Key information includes event names, attendee names, "
+            "You are a helpful assistant. Update the running summary of this conversation with the new messages. "
+            "Keep the key facts, entities, and user decisions. Key information includes event names, attendee names, "
             "preferred times, and meeting durations. The summary should be concise and clear."
-            "\n\n--- Conversation to Summarize ---\n"
-            + "\n".join([f"{msg.__class__.__name__}: {msg.content}" for msg in messages_to_summarize])
+            f"\n\n--- Current Summary ---\n{previous_summary or '(empty)'}"
+            "\n\n--- New Messages ---\n"
+            + "\n".join(lines)
         )
+        with span("agent.summarize", messages=len(new_messages), input_tokens=input_tokens):
+            return self.llm.invoke(summarization_prompt).content
 
-        # 3. Call the base LLM to get the summary
-        summary_text = self.llm.invoke(summarization_prompt).content
-        
-        # 4. Create a new SystemMessage containing the summary
-        summary_message = SystemMessage(
-            content=f"Summary of the conversation so far:\n{summary_text}"
+    def _start_summarization(self):
+        """
+        Starts folding everything except the last messages_to_retain messages into the
+        rolling summary in the background. Does nothing if one is already running.
+        """
+        if self._pending_summary is not None:
+            return
+        cut = self._safe_cut_index(len(self.memory) - self.messages_to_retain)
+        start = 1 if self.memory and self.memory[0] is self._summary_message else 0
+        if cut <= start:
+            return
+        summarized = self.memory[:cut]
+        print(f"--- Summarizing {cut - start} messages in the background ---")
+        future = _summary_executor.submit(
+            contextvars.copy_context().run, self._summarize, self.summary_text, summarized[start:]
         )
+        self._pending_summary = (future, summarized)
 
-        # 5. Rebuild the memory with the summary followed by the recent messages
-        self.memory = [summary_message] + messages_to_keep
+    def _apply_pending_summary(self):
+        """
+        Swaps a finished background summary into memory in one step. The summary
+        replaces exactly the messages it was built from; anything appended since
+        is kept. Returns True if memory was compacted.
+        """
+        if self._pending_summary is None:
+            return False
+        future, summarized = self._pending_summary
+        if not future.done():
+            return False
+        self._pending_summary = None
+
+        try:
+            summary_text = future.result()
+        except Exception as e:
+            print(f"Background summarization failed: {e}")
+            return False
+
+        cut = len(summarized)
+        # Memory only grows between snapshot and swap, unless something else rebuilt it
+        if len(self.memory) < cut or any(a is not b for a, b in zip(self.memory[:cut], summarized)):
+            print("--- Memory changed since summarization started; discarding summary. ---")
+            return False
+
+        self.summary_text = summary_text
+        summary_message = self._summary_message = self._render_summary_message(summary_text)
+        self._replace_memory(
+            [summary_message] + self.memory[cut:],
+            [self._count_message_tokens(summary_message)] + self._token_ledger[cut:],
+        )
         print("--- Memory has been successfully summarized. ---")
+        return True
+
+    def _handle_memory(self):
+        """
+        Applies a finished background summary, if any, and schedules a new one once
+        memory crosses the soft watermark. Never blocks on the LLM.
+        """
+        self._apply_pending_summary()
+
+        token_count = self._get_token_count()
+        print(f"--- Current Token Count: {token_count} ---")
+
+        if token_count > self.summarization_watermark:
+            self._start_summarization()
+
+    def _context_messages(self) -> List[AnyMessage]:
+        """
+        Returns the messages to send to the LLM. If memory is over the hard threshold
+        and the summary isn't ready yet, falls back to the raw recent window.
+        """
+        if self._get_token_count() <= self.summarization_threshold:
+            return self.memory
+        if self._apply_pending_summary() and self._get_token_count() <= self.summarization_threshold:
+            return self.memory
+        print(f"--- Token count exceeds threshold ({self.summarization_threshold}); using the recent window until the summary is ready. ---")
+        self._start_summarization()
+        window = self.memory[self._safe_cut_index(len(self.memory) - self.messages_to_retain):]
+        if self._summary_message is not None and self.memory[0] is self._summary_message and window[0] is not self._summary_message:
+            window = [self._summary_message] + window
+        return window
 
+    def _execute_tool_call(self, tool_call) -> ToolMessage:
+        """Executes a single tool call and wraps its result (or error) in a ToolMessage."""
+        tool_name = tool_call["name"]
+        tool_to_call = self.tools.get(tool_name)
+
+        if not tool_to_call:
+            return ToolMessage(
+                content=f"Error: Tool '{tool_name}' not found.",
+                tool_call_id=tool_call["id"],
+            )
+        with span(f"tool.{tool_name}") as tool_span:
+            try:
+                tool_output = tool_to_call.invoke(tool_call["args"])
+                return ToolMessage(content=str(tool_output), tool_call_id=tool_call["id"])
+            except Exception as e:
+                tool_span.set(error=str(e))
+                error_msg = f"Error executing tool {tool_name}: {str(e)}"
+                return ToolMessage(content=error_msg, tool_call_id=tool_call["id"])
 
     def _execute_tool_calls(self, ai_message: AIMessage) -> List[ToolMessage]:
         """
-        Executes tool calls requested by the LLM and returns the results.
+        Executes tool calls requested by the LLM and returns the results in the
+        original call order. Consecutive read-only calls run in parallel; write
+        calls act as barriers and run one at a time, in order.
         """
-        tool_messages = []
-        for tool_call in ai_message.tool_calls:
-            tool_name = tool_call["name"]
-            tool_to_call = self.tools.get(tool_name)
+        tool_calls = ai_message.tool_calls
+        tool_messages: List[ToolMessage] = [None] * len(tool_calls)
+        script_ctx = get_script_run_ctx(suppress_warning=True)  # None on turn-service threads
+        pending = []  # indices of read-only calls waiting to run
 
-            if tool_to_call:
-                try:
-                    tool_output = tool_to_call.invoke(tool_call["args"])
-                    tool_messages.append(
-                        ToolMessage(content=str(tool_output), tool_call_id=tool_call["id"])
-                    )
-                except Exception as e:
-                    error_msg = f"Error executing tool {tool_name}: {str(e)}"
-                    tool_messages.append(
-                        ToolMessage(content=error_msg, tool_call_id=tool_call["id"])
+        def run_pending():
+            if len(pending) == 1:
+                index = pending[0]
+                tool_messages[index] = self._execute_tool_call(tool_calls[index])
+            elif pending:
+                futures = {
+                    index: _tool_executor.submit(
+                        contextvars.copy_context().run,
+                        _run_with_script_ctx, script_ctx, self._execute_tool_call, tool_calls[index],
                     )
+                    for index in pending
+                }
+                for index, future in futures.items():
+                    tool_messages[index] = future.result()
+            pending.clear()
+
+        for index, tool_call in enumerate(tool_calls):
+            if tool_call["name"] in WRITE_TOOLS:
+                run_pending()
+                tool_messages[index] = self._execute_tool_call(tool_call)
             else:
-                tool_messages.append(
-                    ToolMessage(
-                        content=f"Error: Tool '{tool_name}' not found.",
-                        tool_call_id=tool_call["id"],
-                    )
-                )
+                pending.append(index)
+        run_pending()
         return tool_messages
 
     def invoke(self, message: str) -> str:
@@ -135,9 +396,9 @@ class SchedulingAgent:
         manages the conversation loop, and returns the final response.
         """
         # 1. Add the new user message to the conversation memory
-        self.memory.append(HumanMessage(content=message))
+        self._append_memory(HumanMessage(content=message))
 
-        # 2. **NEW STEP**: Handle memory summarization if needed
+        # 2. Swap in a finished background summary, or start one if memory is large
         self._handle_memory()
 
         # 3. Start the core agent loop
@@ -145,36 +406,268 @@ class SchedulingAgent:
             for msg in self.memory:
                 print(f"{msg.__class__.__name__}: {msg.content}")
             print("--- Invoking LLM with current memory ---")
-            response: AIMessage = self.llm_with_tools.invoke(
-                [self.system_prompt] + self.memory
-            )
+            context = [self.system_prompt] + self._context_messages()
+            with span("llm.invoke", messages=len(context), context_tokens=self._get_token_count()) as llm_span:
+                response: AIMessage = self.llm_with_tools.invoke(context)
+                llm_span.set(tool_calls=len(response.tool_calls), **_usage_attributes(response))
 
             if not response.tool_calls:
-                self.memory.append(response)
+                self._append_memory(response)
+                # Compact memory after answering so the next turn doesn't pay for it
+                self._handle_memory()
                 return response.content
 
-            self.memory.append(response)
+            self._append_memory(response)
             tool_results = self._execute_tool_calls(response)
-            self.memory.extend(tool_results)
+            self._append_memory(*tool_results)
             # The loop will repeat with the tool results in memory
 
+    def stream(self, message: str):
+        """
+        Streaming variant of invoke(). Runs the same tool-calling loop but
+        yields the text of the final answer token by token as the LLM produces it.
+        """
+        self._append_memory(HumanMessage(content=message))
+        self._handle_memory()
+
+        while True:
+            print("--- Streaming LLM with current memory ---")
+            response = None
+            context = [self.system_prompt] + self._context_messages()
+            # Not a context manager: the span must not become current while we're suspended at a yield
+            llm_span = start_span("llm.stream", messages=len(context), context_tokens=self._get_token_count())
+            try:
+                for chunk in self.llm_with_tools.stream(context):
+                    if response is None:
+                        llm_span.set(first_chunk_ms=round(llm_span.elapsed_ms(), 1))
+                    response = chunk if response is None else response + chunk
+                    # Once the model starts calling tools this is not the final answer
+                    if not response.tool_call_chunks:
+                        text = _content_text(chunk.content)
+                        if text:
+                            yield text
+            except BaseException as e:
+                llm_span.end(error=e)
+                raise
+
+            if response is None:
+                llm_span.end()
+                return
+            response = message_chunk_to_message(response)
+            llm_span.set(tool_calls=len(response.tool_calls), **_usage_attributes(response))
+            llm_span.end()
+            self._append_memory(response)
+            if not response.tool_calls:
+                self._handle_memory()
+                return
+
+            tool_results = self._execute_tool_calls(response)
+            self._append_memory(*tool_results)
+
+    # --- Async variants (used by the turn service) ---
+    # Tools stay synchronous (googleapiclient) and run in a worker thread.
+    # Callers must not run two turns for the same agent at once; the turn
+    # service guarantees this by processing each user's turns in order.
+
+    def _close_interrupted_turn(self):
+        """
+        Leaves memory valid after a cancelled turn: unanswered tool calls get a
+        "cancelled" result and the turn is closed with a short assistant note.
+        """
+        last = self.memory[-1] if self.memory else None
+        if isinstance(last, AIMessage) and last.tool_calls:
+            self._append_memory(*[
+                ToolMessage(
+                    content="Cancelled: the user interrupted this request before it finished (it may still have completed).",
+                    tool_call_id=call["id"],
+                )
+                for call in last.tool_calls
+            ])
+        if not isinstance(self.memory[-1], AIMessage) or self.memory[-1].tool_calls:
+            self._append_memory(AIMessage(content="(The user interrupted this reply.)"))
+
+    async def ainvoke(self, message: str) -> str:
+        """Async variant of invoke() using the LLM's ainvoke."""
+        self._append_memory(HumanMessage(content=message))
+        self._handle_memory()
+        try:
+            while True:
+                context = [self.system_prompt] + self._context_messages()
+                with span("llm.invoke", messages=len(context), context_tokens=self._get_token_count()) as llm_span:
+                    response: AIMessage = await self.llm_with_tools.ainvoke(context)
+                    llm_span.set(tool_calls=len(response.tool_calls), **_usage_attributes(response))
+
+                self._append_memory(response)
+                if not response.tool_calls:
+                    self._handle_memory()
+                    return response.content
+
+                tool_results = await asyncio.to_thread(self._execute_tool_calls, response)
+                self._append_memory(*tool_results)
+        except asyncio.CancelledError:
+            self._close_interrupted_turn()
+            raise
+
+    async def astream(self, message: str):
+        """Async variant of stream(); yields the final answer as text chunks."""
+        self._append_memory(HumanMessage(content=message))
+        self._handle_memory()
+        try:
+            while True:
+                response = None
+                context = [self.system_prompt] + self._context_messages()
+                llm_span = start_span("llm.stream", messages=len(context), context_tokens=self._get_token_count())
+                try:
+                    async for chunk in self.llm_with_tools.astream(context):
+                        if response is None:
+                            llm_span.set(first_chunk_ms=round(llm_span.elapsed_ms(), 1))
+                        response = chunk if response is None else response + chunk
+                        if not response.tool_call_chunks:
+                            text = _content_text(chunk.content)
+                            if text:
+                                yield text
+                except BaseException as e:
+                    llm_span.end(error=e)
+                    raise
+
+                if response is None:
+                    llm_span.end()
+                    return
+                response = message_chunk_to_message(response)
+                llm_span.set(tool_calls=len(response.tool_calls), **_usage_attributes(response))
+                llm_span.end()
+                self._append_memory(response)
+                if not response.tool_calls:
+                    self._handle_memory()
+                    return
+
+                tool_results = await asyncio.to_thread(self._execute_tool_calls, response)
+                self._append_memory(*tool_results)
+        except (asyncio.CancelledError, GeneratorExit):
+            self._close_interrupted_turn()
+            raise
+
 
 # --- Agent Initialization ---
 
+TOOLS = [get_events_between_start_and_end, set_calender_event, find_event_by_name , get_current_date_time, update_event, delete_event, get_free_availability, create_events, update_events, delete_events]
+
+_agent_template = None
+_agent_template_lock = threading.Lock()
+
+
+def get_agent_template():
+    """
+    Builds the resources shared by every session agent exactly once: the raw
+    system prompt, the LLM, the LLM with tools bound and the tokenizer.
+    """
+    global _agent_template
+    with _agent_template_lock:
+        if _agent_template is None:
+            with open('prompt.txt', "r", encoding="utf-8") as f:
+                prompt_template = f.read()
+            llm = get_llm()
+            _agent_template = {
+                "prompt_template": prompt_template,
+                "llm": llm,
+                "llm_with_tools": llm.bind_tools(TOOLS),
+                "tokenizer": get_tokenizer(),
+            }
+        return _agent_template
+
+
 def get_agent():
-    """Initializes the scheduling agent."""
-    with open('prompt.txt', "r", encoding="utf-8") as f:
-        system_prompt = f.read()
-    system_prompt = system_prompt.replace("{current_datetime_str}", get_current_date_time('datetime'))
-    tools = [get_events_between_start_and_end, set_calender_event, find_event_by_name , get_current_date_time, update_event, delete_event]
-    
-    agent_instance = SchedulingAgent(tools=tools, system_prompt=system_prompt)
+    """Initializes a scheduling agent from the shared template."""
+    template = get_agent_template()
+    system_prompt = template["prompt_template"].replace("{current_datetime_str}", get_current_date_time('datetime'))
+
+    agent_instance = SchedulingAgent(
+        tools=TOOLS,
+        system_prompt=system_prompt,
+        llm=template["llm"],
+        llm_with_tools=template["llm_with_tools"],
+        tokenizer=template["tokenizer"],
+    )
     return agent_instance
 
-my_agent = get_agent()
 
-def agent(message):
-    return my_agent.invoke(message)
+class AgentPool:
+    """
+    A bounded, session-scoped registry of agents keyed by user_id.
+    Agents are created lazily on first use and evicted when the pool is full
+    (least recently used first) or when they have been idle for too long.
+    """
+
+    def __init__(self, factory, max_agents=200, idle_timeout=60 * 60):
+        self.factory = factory
+        self.max_agents = max_agents
+        self.idle_timeout = idle_timeout
+        self._agents = OrderedDict()  # user_id -> (agent, last_used)
+        self._lock = threading.Lock()
+
+    def _evict_idle(self, now):
+        """Removes agents that have not been used within idle_timeout."""
+        while self._agents:
+            user_id, (_, last_used) = next(iter(self._agents.items()))
+            if now - last_used <= self.idle_timeout:
+                break
+            del self._agents[user_id]
+
+    def get(self, user_id):
+        """Returns the agent for user_id, creating it if needed."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._agents.get(user_id)
+            if entry is not None:
+                self._agents[user_id] = (entry[0], now)
+                self._agents.move_to_end(user_id)
+                return entry[0]
+
+        # Build outside the lock so one slow creation doesn't block other users
+        new_agent = self.factory()
+
+        with self._lock:
+            entry = self._agents.get(user_id)
+            if entry is not None:
+                # Another thread created it first; keep theirs
+                new_agent = entry[0]
+            self._agents[user_id] = (new_agent, now)
+            self._agents.move_to_end(user_id)
+            while len(self._agents) > self.max_agents:
+                self._agents.popitem(last=False)
+        return new_agent
+
+    def discard(self, user_id):
+        """Drops the agent (and its memory) for user_id, e.g. on logout."""
+        with self._lock:
+            self._agents.pop(user_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._agents)
+
+
+agent_pool = AgentPool(get_agent)
+
+
+def agent(message, user_id="default"):
+    """Runs one turn for the given user with their own session agent."""
+    with span("agent.turn", streaming=False):
+        session_agent = agent_pool.get(user_id)
+        with session_agent.lock:
+            return session_agent.invoke(message)
+
+
+def agent_stream(message, user_id="default"):
+    """Streaming variant of agent(); yields the final answer as text chunks."""
+    turn_span = start_span("agent.turn", streaming=True)
+    try:
+        session_agent = agent_pool.get(user_id)
+        with session_agent.lock:
+            yield from session_agent.stream(message)
+    finally:
+        turn_span.end()
 
 # Example usage (for testing)
 if __name__ == "__main__":
@@ -1,20 +1,22 @@
 import streamlit as st
 import json
 import os
-# from text_to_speech import generate_tts
-from text_to_speech import generate_tts
-from speech_to_text import transcribe_audio
+from credential_cache import credential_cache
+from oauth_state_store import FirestoreOAuthStateStore, SQLiteOAuthStateStore, InMemoryOAuthStateStore
 # from agent_from_scratch import agent
-from audio_recorder_streamlit import audio_recorder
-from streamlit_float import *
-from streamlit_js_eval import streamlit_js_eval
 import base64
+import hashlib
 import re
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from google.cloud.firestore_v1.transforms import SERVER_TIMESTAMP
+import time
+import threading
+import uuid
+import streamlit.components.v1 as components
+from streamlit import runtime
+from contextlib import nullcontext
+from tracing import span, trace_stats
+# Heavy SDKs (firebase_admin, google_auth_oauthlib, elevenlabs, the agent and its
+# LLM) are imported on the code path that first needs them, which keeps the
+# login screen and cold starts fast. See benchmarks/import_profile.py.
 # --- Basic App Configuration ---
 st.set_page_config(page_title="Google Calendar Agent", layout="wide")
 st.title("🗓️ Google Calendar Agent")
@@ -66,19 +68,44 @@ else:
 
 
 # --- Firebase Firestore Setup ---
-try:
-    if "firebase_service_account" in st.secrets:
-        creds_dict = dict(st.secrets["firebase_service_account"])
-        firebase_creds = credentials.Certificate(creds_dict)
+@st.cache_resource
+def get_firestore_client():
+    """
+    Initializes Firebase once per process and returns a Firestore client, or
+    None if it is not configured. firebase_admin is imported only when needed.
+    """
+    if "firebase_service_account" not in st.secrets:
+        return None
+    try:
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        firebase_creds = credentials.Certificate(dict(st.secrets["firebase_service_account"]))
         if not firebase_admin._apps:
             firebase_admin.initialize_app(firebase_creds)
-        db = firestore.client()
-    else:
-        st.warning("Firebase service account not found. App cannot save tokens.")
-        db = None
-except Exception as e:
-    st.error(f"Failed to initialize Firebase: {e}")
-    db = None
+        return firestore.client()
+    except Exception as e:
+        st.error(f"Failed to initialize Firebase: {e}")
+        return None
+
+if "firebase_service_account" not in st.secrets:
+    st.warning("Firebase service account not found. App cannot save tokens.")
+
+# --- OAuth State Store ---
+@st.cache_resource
+def get_oauth_state_store(backend):
+    """One state store per process, so pending logins survive reruns and redirects."""
+    if backend == "firestore":
+        return FirestoreOAuthStateStore(get_firestore_client())
+    if backend == "memory":
+        return InMemoryOAuthStateStore()
+    return SQLiteOAuthStateStore()
+
+def get_state_store():
+    """The state store is only needed during login, so it is created on first use."""
+    # Firestore when available; OAUTH_STATE_BACKEND=sqlite|memory for local testing
+    backend = os.getenv("OAUTH_STATE_BACKEND") or ("firestore" if get_firestore_client() else "sqlite")
+    return get_oauth_state_store(backend)
 
 # --- Google API Configuration ---
 if "google_credentials" not in st.secrets:
@@ -102,22 +129,23 @@ except (ImportError, AttributeError):
 
 # --- Helper Functions ---
 
+def oauth_flow():
+    """Creates an OAuth flow; google_auth_oauthlib is only imported during login."""
+    from google_auth_oauthlib.flow import Flow
+
+    return Flow.from_client_config(CLIENT_CONFIG, scopes=SCOPES, redirect_uri=REDIRECT_URI)
+
 def get_auth_url(user_id):
     """Generates a Google OAuth URL, saving the user_id with the state."""
-    flow = Flow.from_client_config(
-        CLIENT_CONFIG, scopes=SCOPES, redirect_uri=REDIRECT_URI
-    )
+    flow = oauth_flow()
     authorization_url, state = flow.authorization_url(
         access_type='offline', include_granted_scopes='true'
     )
-    # Store the state and the user_id in Firestore for robust verification
-    if db:
-        db.collection('oauth_states').document(state).set({
-            'timestamp': SERVER_TIMESTAMP,
-            'user_id': user_id
-        })
-    else:
-        st.error("Database connection not available. Cannot store OAuth state.")
+    # Store the state and the user_id for robust verification; states expire on their own
+    try:
+        get_state_store().put(state, user_id)
+    except Exception as e:
+        st.error(f"Cannot store OAuth state: {e}")
     return authorization_url, flow
 
 def exchange_code_for_creds(code, flow):
@@ -127,42 +155,40 @@ def exchange_code_for_creds(code, flow):
 
 def save_creds_to_firestore(user_id, creds):
     """Saves credentials to Firestore."""
+    db = get_firestore_client()
     if db and user_id:
         creds_json = creds.to_json()
         db.collection('user_tokens').document(user_id).set({'token_json': creds_json})
 
 def load_creds_from_firestore(user_id):
     """Loads credentials from Firestore."""
+    db = get_firestore_client()
     if db and user_id:
         doc = db.collection('user_tokens').document(user_id).get()
         if doc.exists:
+            from google.oauth2.credentials import Credentials
+
             token_json = doc.to_dict().get('token_json')
             return Credentials.from_authorized_user_info(json.loads(token_json), SCOPES)
     return None
 
 def verify_state_and_restore_user_id(state):
     """
-    Verifies the state from Firestore, restores the user_id to the session,
-    and deletes the state document. Returns the user_id on success.
+    Takes the state out of the state store in one atomic step (it is single-use
+    for security), restores the user_id to the session and returns it on success.
     """
-    if not db:
-        st.error("Database connection not available for state verification.")
-        return None
     try:
-        state_ref = db.collection('oauth_states').document(state)
-        state_doc = state_ref.get()
-        if state_doc.exists:
-            user_id = state_doc.to_dict().get('user_id')
+        user_id = get_state_store().pop(state)
+        if user_id:
             st.session_state['user_id'] = user_id
-            state_ref.delete() # State is single-use for security
-            return user_id
-        return None
+        return user_id
     except Exception as e:
-        st.error(f"Error verifying OAuth state from Firestore: {e}")
+        st.error(f"Error verifying OAuth state: {e}")
         return None
 
 def delete_creds_from_firestore(user_id):
     """Deletes a user's credentials from Firestore."""
+    db = get_firestore_client()
     if db and user_id:
         try:
             db.collection('user_tokens').document(user_id).delete()
@@ -186,11 +212,12 @@ if "code" in query_params and "state" in query_params:
     
     restored_user_id = verify_state_and_restore_user_id(state)
     if restored_user_id:
-        flow = Flow.from_client_config(CLIENT_CONFIG, scopes=SCOPES, redirect_uri=REDIRECT_URI)
+        flow = oauth_flow()
         creds = exchange_code_for_creds(code, flow)
         if creds:
             st.session_state['credentials'] = creds
             save_creds_to_firestore(restored_user_id, creds)
+            credential_cache.put(restored_user_id, creds)
             st.success("Authentication successful and token saved!")
             st.query_params.clear()
             st.rerun()
@@ -217,8 +244,8 @@ if not st.session_state.get('user_id'):
 user_id = st.session_state['user_id']
 st.sidebar.success(f"Logged in as: **{user_id}**")
 
-# Attempt to load credentials for the logged-in user
-st.session_state['credentials'] = load_creds_from_firestore(user_id)
+# Attempt to load credentials for the logged-in user (cached across reruns)
+st.session_state['credentials'] = credential_cache.get(user_id, load_creds_from_firestore)
 
 # Display content based on whether the user has authenticated with Google
 if not st.session_state['credentials']:
@@ -242,26 +269,153 @@ if not st.session_state['credentials']:
     # """
     # st.markdown(button_html, unsafe_allow_html=True)
 else:
-    from agent import agent
+    from agent import agent, agent_stream, agent_pool
+    from calenderTool import invalidate_calendar_service, invalidate_calendar_metadata, invalidate_event_cache, get_calendar_metadata_stats
+    from text_to_speech import generate_tts, stream_tts, prewarm_tts_cache, TTS_PREWARM_PHRASES, AUDIO_PRESETS, audio_mime_type, clean_text
+    from turn_service import TurnService, TurnQueueFull, process_voice_turn
+    from speech_to_text import transcribe_audio
+    from audio_preprocessing import preprocess_audio
+    from audio_recorder_streamlit import audio_recorder
+    from streamlit_float import float_init
+
+    # --- TTS Cache Pre-warming ---
+    @st.cache_resource
+    def start_tts_prewarm(output_format):
+        """Synthesizes TTS_PREWARM_PHRASES in output_format once per process, in the background."""
+        thread = threading.Thread(target=prewarm_tts_cache, args=(TTS_PREWARM_PHRASES, output_format), daemon=True)
+        thread.start()
+        return thread
+
+    @st.cache_resource
+    def get_turn_service():
+        """One background turn service per process, shared by every session."""
+        return TurnService()
+
     # This section is shown only after the user is fully logged in and authenticated
     st.sidebar.info("✅ You are connected to your Google Calendar.")
     st.sidebar.header("Account")
-    # if st.sidebar.button("Logout and Revoke Access"):
-    #     delete_creds_from_firestore(st.session_state.get('user_id'))
-    #     st.session_state['credentials'] = None
-    #     st.session_state['user_id'] = None # Clear user_id to force re-entry
-    #     st.rerun()
+    if st.sidebar.button("Logout and Revoke Access"):
+        invalidate_calendar_service(st.session_state['credentials'])
+        invalidate_calendar_metadata(st.session_state['credentials'])
+        invalidate_event_cache(st.session_state['credentials'])
+        get_turn_service().cancel(st.session_state.get('user_id'))
+        st.session_state.pop('active_turn', None)
+        agent_pool.discard(st.session_state.get('user_id'))
+        delete_creds_from_firestore(st.session_state.get('user_id'))
+        credential_cache.invalidate(st.session_state.get('user_id'))
+        st.session_state['credentials'] = None
+        st.session_state['user_id'] = None # Clear user_id to force re-entry
+        st.rerun()
 
     float_init()
 
-    def autoplay_audio(wav_bytes):
-        b64 = base64.b64encode(wav_bytes).decode("utf-8")
-        md = f"""
-        <audio autoplay>
-        <source src="data:audio/wav;base64,{b64}" type="audio/wav">
-        </audio>
+    def serve_audio(audio, mimetype):
+        """
+        Hands audio to Streamlit's media endpoint, which serves it with the right
+        MIME type and byte-range support, and returns its URL.
+        """
+        if runtime.exists():
+            return runtime.get_instance().media_file_mgr.add(audio, mimetype, f"tts.{uuid.uuid4().hex}")
+        # Raw mode (no server): fall back to an inline data URI
+        return f"data:{mimetype};base64,{base64.b64encode(audio).decode('utf-8')}"
+
+    def play_audio(audio, output_format):
+        """Plays a complete reply through st.audio instead of an inline base64 blob."""
+        with span("audio.delivery", audio_bytes=len(audio)):
+            st.audio(audio, format=audio_mime_type(output_format), autoplay=True)
+
+    def enqueue_audio(audio, output_format):
         """
-        st.markdown(md, unsafe_allow_html=True)
+        Queues an audio chunk for playback in the browser. Chunks share one
+        promise chain on the parent page, so they play back-to-back in order.
+        """
+        with span("audio.delivery", audio_bytes=len(audio)):
+            url = serve_audio(audio, audio_mime_type(output_format))
+            components.html(f"""
+        <script>
+        const w = window.parent;
+        w.__ttsQueue = (w.__ttsQueue || Promise.resolve()).then(() => new Promise((resolve) => {{
+            const audio = new w.Audio("{url}");
+            audio.onended = resolve;
+            audio.onerror = resolve;
+            audio.play().catch(resolve);
+        }}));
+        </script>
+            """, height=0)
+
+    def start_service_turn(audio_bytes):
+        """Hands a new recording to the turn service, replacing this user's unfinished turn."""
+        turn_service = get_turn_service()
+        # A new recording supersedes whatever the previous turn was still doing
+        turn_service.cancel(user_id)
+        try:
+            turn = turn_service.submit(user_id, process_voice_turn, user_id, audio_bytes,
+                                       st.session_state['credentials'], output_format, stream_replies)
+        except TurnQueueFull as e:
+            st.warning(str(e))
+            return
+        st.session_state['active_turn'] = {"turn": turn, "started": time.perf_counter(), "first_audio": None}
+
+    def render_service_turn():
+        """
+        Shows the active turn's events as they arrive. If Streamlit interrupts
+        this run, the next rerun picks up where this one left off.
+        """
+        active = st.session_state['active_turn']
+        turn = active["turn"]
+        status = st.empty()
+        reply_box = text_placeholder = None
+        spoken = []
+        while True:
+            event = turn.next_event(timeout=0.25)
+            if event is None:
+                # Writing to the page lets Streamlit stop this run when the user records again
+                status.caption(f"Thinking🤔... {time.perf_counter() - active['started']:.0f}s")
+                continue
+            kind, payload = event
+            if kind == "transcript":
+                st.session_state.messages.append({"role": "user", "content": payload})
+                with st.chat_message("user"):
+                    st.write(payload)
+            elif kind == "audio":
+                sentence, audio = payload
+                if active["first_audio"] is None:
+                    active["first_audio"] = time.perf_counter() - active["started"]
+                if reply_box is None:
+                    reply_box = st.chat_message("assistant")
+                    text_placeholder = reply_box.empty()
+                with reply_box:
+                    if stream_replies:
+                        enqueue_audio(audio, output_format)
+                    else:
+                        play_audio(audio, output_format)
+                spoken.append(sentence)
+                text_placeholder.write(" ".join(spoken))
+            elif kind == "reply":
+                st.session_state.messages.append({"role": "assistant", "content": payload})
+            elif kind == "no_speech":
+                st.info("No speech detected. Please try again.")
+            elif kind == "error":
+                st.error(f"Sorry, something went wrong: {payload}")
+            elif kind == "done":
+                break
+        status.empty()
+        del st.session_state['active_turn']
+        if active["first_audio"] is not None:
+            print(f"--- Time to first audio: {active['first_audio']:.2f}s (streaming={stream_replies}, service) ---")
+            st.caption(f"Time to first audio: {active['first_audio']:.2f}s")
+        # Persist the token only if google-auth refreshed it during this turn
+        credential_cache.write_back_if_refreshed(user_id, st.session_state['credentials'], save_creds_to_firestore)
+
+    stream_replies = st.sidebar.checkbox("Stream voice replies", value=True,
+                                         help="Start speaking each sentence as soon as it is ready.")
+    use_turn_service = st.sidebar.checkbox("Background turn service", value=True,
+                                           help="Process turns on the shared async service instead of in this page's script.")
+    audio_preset = st.sidebar.selectbox("Audio quality", list(AUDIO_PRESETS),
+                                        help="Lower presets use less bandwidth.")
+    output_format = AUDIO_PRESETS[audio_preset]
+    if TTS_PREWARM_PHRASES and os.getenv("ELEVENLABS_API_KEY"):
+        start_tts_prewarm(output_format)
 
     # Initialize session state for managing chat messages
     def initialize_session_state():
@@ -282,26 +436,98 @@ else:
         with st.chat_message(message["role"]):
             st.write(message["content"])
 
-    if audio_bytes:
-        with st.spinner("Transcribing..."):
-            transcript = transcribe_audio(audio_bytes)
-            if transcript:
-                st.session_state.messages.append({"role": "user", "content": transcript})
-                with st.chat_message("user"):
-                    st.write(transcript)
+    if use_turn_service:
+        # The recorder keeps returning its last clip on every rerun; submit each clip once
+        audio_digest = hashlib.sha256(audio_bytes).hexdigest() if audio_bytes else None
+        if audio_digest and audio_digest != st.session_state.get('last_audio_digest'):
+            st.session_state['last_audio_digest'] = audio_digest
+            start_service_turn(audio_bytes)
+        if 'active_turn' in st.session_state:
+            render_service_turn()
+    else:
+        # One trace per voice turn; the agent, tool, Google API and TTS spans nest under it
+        with (span("voice_turn", user_id=user_id) if audio_bytes else nullcontext()) as turn_span:
+            if audio_bytes:
+                with st.spinner("Transcribing..."):
+                    try:
+                        with span("audio.preprocess", audio_bytes=len(audio_bytes)) as preprocess_span:
+                            speech_bytes, audio_stats = preprocess_audio(audio_bytes)
+                            preprocess_span.set(processed_bytes=audio_stats["processed_bytes"], speech=audio_stats["speech"])
+                        print(
+                            f"--- Audio preprocessing: {audio_stats['original_bytes']} -> {audio_stats['processed_bytes']} bytes "
+                            f"({audio_stats['bytes_saved']} saved), {audio_stats['trimmed_ms']} ms of silence trimmed "
+                            f"in {audio_stats['processing_ms']:.1f} ms ---"
+                        )
+                    except Exception as e:
+                        print(f"Audio preprocessing failed, sending the raw recording: {e}")
+                        speech_bytes = audio_bytes
+                    if speech_bytes is None:
+                        st.info("No speech detected. Please try again.")
+                        transcript = None
+                    else:
+                        transcribe_started = time.perf_counter()
+                        transcript = transcribe_audio(speech_bytes)
+                        print(f"--- Transcription took {time.perf_counter() - transcribe_started:.2f}s ---")
+                    if transcript:
+                        st.session_state.messages.append({"role": "user", "content": transcript})
+                        with st.chat_message("user"):
+                            st.write(transcript)
                 
                 
-    if st.session_state.messages[-1]["role"] != "assistant":
-        with st.chat_message("assistant"):
-            with st.spinner("Thinking🤔..."):
-                final_response = agent(st.session_state.messages[-1]["content"])
-                final_response = re.sub(r"[^a-zA-Z0-9 ,.!?'-]", '', final_response)
-            with st.spinner("Generating audio response..."):
-                audio_bytes = generate_tts(final_response)
-                autoplay_audio(audio_bytes)
-            st.write(final_response)
-            st.session_state.messages.append({"role": "assistant", "content": final_response})
+            if st.session_state.messages[-1]["role"] != "assistant":
+                with st.chat_message("assistant"):
+                    turn_started = time.perf_counter()
+                    time_to_first_audio = None
+                    if stream_replies:
+                        text_placeholder = st.empty()
+                        spoken = []
+                        with st.spinner("Thinking🤔..."):
+                            tokens = (clean_text(token) for token in agent_stream(st.session_state.messages[-1]["content"], user_id=user_id))
+                            for sentence, sentence_audio in stream_tts(tokens, output_format):
+                                if time_to_first_audio is None:
+                                    time_to_first_audio = time.perf_counter() - turn_started
+                                enqueue_audio(sentence_audio, output_format)
+                                spoken.append(sentence)
+                                text_placeholder.write(" ".join(spoken))
+                        final_response = " ".join(spoken)
+                    else:
+                        with st.spinner("Thinking🤔..."):
+                            final_response = agent(st.session_state.messages[-1]["content"], user_id=user_id)
+                            final_response = re.sub(r"[^a-zA-Z0-9 ,.!?'-]", '', final_response)
+                        with st.spinner("Generating audio response..."):
+                            audio_bytes = generate_tts(final_response, output_format)
+                            time_to_first_audio = time.perf_counter() - turn_started
+                            play_audio(audio_bytes, output_format)
+                        st.write(final_response)
+                    if time_to_first_audio is not None:
+                        print(f"--- Time to first audio: {time_to_first_audio:.2f}s (streaming={stream_replies}) ---")
+                        st.caption(f"Time to first audio: {time_to_first_audio:.2f}s")
+                        if turn_span is not None:
+                            turn_span.set(time_to_first_audio_ms=round(time_to_first_audio * 1000, 1), streaming=stream_replies)
+                    st.session_state.messages.append({"role": "assistant", "content": final_response})
+                    # Persist the token only if google-auth refreshed it during this turn
+                    credential_cache.write_back_if_refreshed(user_id, st.session_state['credentials'], save_creds_to_firestore)
             
 
     # Float the footer container and provide CSS to target it with
     footer_container.float("bottom: 0rem;")
+
+    # --- Latency Dashboard ---
+    with st.sidebar.expander("Latency by stage (p50 / p95 / p99)"):
+        stage_stats = trace_stats()
+        if stage_stats:
+            st.dataframe(stage_stats, hide_index=True, use_container_width=True)
+        else:
+            st.caption("No voice turns traced yet.")
+        from calendar_scheduler import scheduler
+        calendar_stats = scheduler.stats
+        st.caption(
+            f"Calendar requests: {calendar_stats['requests']} · throttled {calendar_stats['throttled']} · "
+            f"retries {calendar_stats['retries']} · deduplicated {calendar_stats['deduplicated']} · "
+            f"rejected {calendar_stats['rejected']} · failed {calendar_stats['failed']}"
+        )
+        metadata_stats = get_calendar_metadata_stats()
+        st.caption(
+            f"Calendar metadata cache: {metadata_stats['hits']} hits · {metadata_stats['misses']} misses "
+            f"({metadata_stats['round_trips_saved']} round trips saved)"
+        )
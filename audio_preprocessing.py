@@ -0,0 +1,88 @@
+"""
+Audio clean-up before transcription.
+
+The recorder hands over everything it captured, including leading silence and
+the pause that ends the recording. A vectorized energy-based voice activity
+detector finds where speech starts and ends, the silence around it is trimmed,
+clips without speech are dropped, and the rest is downmixed/downsampled to a
+compact mono format before upload.
+"""
+
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from pydub import AudioSegment
+
+VAD_FRAME_MS = 30  # analysis frame length
+VAD_MARGIN_DB = 12  # how far above the noise floor a frame must be to count as speech
+VAD_MIN_THRESHOLD_DBFS = -50  # never treat quieter frames as speech
+VAD_MAX_THRESHOLD_DBFS = -35  # never require louder frames than this
+VAD_MIN_SPEECH_MS = 200  # less detected speech than this means "no speech"
+VAD_PADDING_MS = 250  # silence kept around the speech so words aren't clipped
+
+# Output sent to STT: mono, downsampled; "wav" needs no ffmpeg, "ogg"/"mp3" are smaller
+TARGET_SAMPLE_RATE = int(os.getenv("STT_SAMPLE_RATE", "16000"))
+TARGET_FORMAT = os.getenv("STT_AUDIO_FORMAT", "wav")
+
+
+def detect_speech(samples, sample_rate, full_scale):
+    """
+    Returns the (start, end) sample indices of the speech in a mono signal, or
+    None if there is too little of it. Frame energies are computed in one
+    vectorized pass and compared against an adaptive noise-floor threshold.
+    """
+    frame = max(int(sample_rate * VAD_FRAME_MS / 1000), 1)
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return None
+
+    frames = samples[:n_frames * frame].reshape(n_frames, frame).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1)) + 1e-9
+    db = 20 * np.log10(rms / full_scale)
+
+    noise_floor = np.percentile(db, 10)
+    threshold = np.clip(noise_floor + VAD_MARGIN_DB, VAD_MIN_THRESHOLD_DBFS, VAD_MAX_THRESHOLD_DBFS)
+    speech = np.flatnonzero(db > threshold)
+    if len(speech) * VAD_FRAME_MS < VAD_MIN_SPEECH_MS:
+        return None
+    return speech[0] * frame, (speech[-1] + 1) * frame
+
+
+def preprocess_audio(audio_bytes):
+    """
+    Trims silence from a recorded clip and re-encodes it compactly.
+    Returns (processed_bytes, stats); processed_bytes is None if the clip has no speech.
+    """
+    started = time.perf_counter()
+    segment = AudioSegment.from_file(BytesIO(audio_bytes), format="wav").set_channels(1)
+    samples = np.array(segment.get_array_of_samples())
+    full_scale = float(1 << (8 * segment.sample_width - 1))
+
+    stats = {
+        "original_bytes": len(audio_bytes),
+        "original_ms": len(segment),
+        "processed_bytes": 0,
+        "processed_ms": 0,
+    }
+
+    bounds = detect_speech(samples, segment.frame_rate, full_scale)
+    if bounds is None:
+        stats["speech"] = False
+    else:
+        start_ms = max(bounds[0] * 1000 // segment.frame_rate - VAD_PADDING_MS, 0)
+        end_ms = min(bounds[1] * 1000 // segment.frame_rate + VAD_PADDING_MS, len(segment))
+        trimmed = segment[start_ms:end_ms]
+        if segment.frame_rate > TARGET_SAMPLE_RATE:
+            trimmed = trimmed.set_frame_rate(TARGET_SAMPLE_RATE)
+
+        output = BytesIO()
+        trimmed.export(output, format=TARGET_FORMAT)
+        processed = output.getvalue()
+        stats.update(speech=True, processed_bytes=len(processed), processed_ms=len(trimmed))
+
+    stats["bytes_saved"] = stats["original_bytes"] - stats["processed_bytes"]
+    stats["trimmed_ms"] = stats["original_ms"] - stats["processed_ms"]
+    stats["processing_ms"] = (time.perf_counter() - started) * 1000
+    return (processed if stats["speech"] else None), stats
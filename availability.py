@@ -0,0 +1,133 @@
+"""
+Local free/busy engine.
+
+Busy intervals for any number of calendars are fetched in bulk with a single
+freebusy().query, merged into one sorted list of disjoint intervals, and the
+free gaps are found with a single linear sweep against the working-hours
+windows. Parsing happens once per interval, never inside the sweep.
+"""
+
+import datetime as dt
+import os
+from dateutil.parser import isoparse
+from tracing import span
+
+DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def parse_working_hours(text):
+    """'09:00-17:00' -> (time(9), time(17))."""
+    try:
+        start, end = (dt.time.fromisoformat(part.strip()) for part in text.split("-"))
+    except ValueError:
+        raise ValueError(f"working hours should look like 09:00-17:00, not '{text}'")
+    if start >= end:
+        raise ValueError(f"working hours must end after they start: '{text}'")
+    return start, end
+
+
+def parse_working_days(text):
+    """'mon-fri' or 'mon,wed,fri' (ranges and lists can be mixed) -> weekday numbers, Monday = 0."""
+    days = set()
+    for part in text.lower().replace(" ", "").split(","):
+        first, _, last = part.partition("-")
+        if first[:3] not in DAY_NAMES or (last and last[:3] not in DAY_NAMES):
+            raise ValueError(f"working days should look like mon-fri or mon,wed,fri, not '{text}'")
+        start = DAY_NAMES.index(first[:3])
+        end = DAY_NAMES.index(last[:3]) if last else start
+        days.update(range(start, end + 1) if start <= end else [*range(start, 7), *range(0, end + 1)])
+    return tuple(sorted(days))
+
+
+# Working-hours constraints used when the caller doesn't override them; set per deployment
+# with WORKING_HOURS="08:00-18:00", WORKING_DAYS="mon-sat" and BUFFER_MINUTES=10
+WORKING_HOURS = parse_working_hours(os.getenv("WORKING_HOURS", "09:00-17:00"))
+WORKING_DAYS = parse_working_days(os.getenv("WORKING_DAYS", "mon-fri"))
+BUFFER_MINUTES = int(os.getenv("BUFFER_MINUTES", "0"))  # Padding kept free before and after every busy interval
+
+# freebusy().query accepts at most 50 calendars per request
+FREEBUSY_MAX_ITEMS = 50
+
+
+def merge_intervals(intervals):
+    """Sorts (start, end) intervals and merges the overlapping or touching ones."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def working_windows(start, end, tz, working_hours=WORKING_HOURS, working_days=WORKING_DAYS):
+    """Yields the working-hours window of each working day, clipped to [start, end)."""
+    day = start.astimezone(tz).date()
+    last_day = end.astimezone(tz).date()
+    while day <= last_day:
+        if day.weekday() in working_days:
+            window_start = tz.localize(dt.datetime.combine(day, working_hours[0]))
+            window_end = tz.localize(dt.datetime.combine(day, working_hours[1]))
+            window_start, window_end = max(window_start, start), min(window_end, end)
+            if window_start < window_end:
+                yield window_start, window_end
+        day += dt.timedelta(days=1)
+
+
+def find_free_slots(busy, start, end, duration, tz, working_hours=WORKING_HOURS,
+                    working_days=WORKING_DAYS, buffer=dt.timedelta(minutes=BUFFER_MINUTES)):
+    """
+    Returns the free (start, end) gaps of at least `duration` inside working
+    hours between start and end. `busy` may be unsorted and overlapping; it is
+    padded by `buffer`, merged, and swept once against the working windows.
+    """
+    merged = merge_intervals((b_start - buffer, b_end + buffer) for b_start, b_end in busy)
+    free = []
+    i = 0
+    for window_start, window_end in working_windows(start, end, tz, working_hours, working_days):
+        # Busy intervals that ended before this window can never matter again
+        while i < len(merged) and merged[i][1] <= window_start:
+            i += 1
+        cursor = window_start
+        j = i
+        while j < len(merged) and merged[j][0] < window_end:
+            busy_start, busy_end = merged[j]
+            if busy_start - cursor >= duration:
+                free.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+            j += 1
+        if window_end - cursor >= duration:
+            free.append((cursor, window_end))
+    return free
+
+
+def _execute(request):
+    with span(f"google.{request.methodId}"):
+        return request.execute()
+
+
+def query_busy(service, calendar_ids, start, end, timezone_str, execute=_execute):
+    """
+    Fetches busy intervals for all calendar_ids with freebusy().query (batched
+    by FREEBUSY_MAX_ITEMS) and returns them merged. Calendars that couldn't be
+    read are reported in the second element of the returned tuple. execute runs
+    each request (the calendar tools pass their quota-aware executor).
+    """
+    busy = []
+    errors = {}
+    for offset in range(0, len(calendar_ids), FREEBUSY_MAX_ITEMS):
+        chunk = calendar_ids[offset:offset + FREEBUSY_MAX_ITEMS]
+        body = {
+            "timeMin": start.isoformat(),
+            "timeMax": end.isoformat(),
+            "timeZone": timezone_str,
+            "items": [{"id": calendar_id} for calendar_id in chunk],
+        }
+        result = execute(service.freebusy().query(body=body))
+        for calendar_id, info in result.get("calendars", {}).items():
+            if info.get("errors"):
+                errors[calendar_id] = info["errors"]
+            for slot in info.get("busy", []):
+                busy.append((isoparse(slot["start"]), isoparse(slot["end"])))
+    return merge_intervals(busy), errors
@@ -0,0 +1,99 @@
+"""
+Benchmark: free-slot search over synthetic calendars.
+
+Compares the old approach (step every 30 minutes and re-parse every busy slot
+with dateutil in the inner loop) with availability.find_free_slots (merge once,
+then one linear sweep). Run from the repository root:
+
+    python benchmarks/bench_availability.py --events 2000 --calendars 3 --days 365
+
+The naive search is O(slots x busy) and would take minutes on a full year, so
+it only runs on the first --naive-days days; the sweep is timed on both.
+"""
+
+import argparse
+import datetime as dt
+import os
+import random
+import sys
+import time
+
+import pytz
+from dateutil.parser import isoparse, parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from availability import find_free_slots, merge_intervals  # noqa: E402
+
+
+def synthetic_busy(tz, start, days, events, calendars, seed=42):
+    """Returns freebusy-style {'start', 'end'} ISO strings spread over several calendars."""
+    rng = random.Random(seed)
+    busy = []
+    for _ in range(events * calendars):
+        day = start + dt.timedelta(days=rng.randrange(days))
+        begin = day.replace(hour=rng.randrange(8, 18), minute=rng.choice((0, 15, 30, 45)))
+        length = dt.timedelta(minutes=rng.choice((15, 30, 45, 60, 90)))
+        busy.append({"start": begin.isoformat(), "end": (begin + length).isoformat()})
+    return busy
+
+
+def naive_free_slots(busy_slots, start, end, duration):
+    """The previous algorithm: 30-minute steps, parsing every busy slot each time."""
+    available = []
+    current = start
+    while current < end:
+        if 9 <= current.hour < 17 and current.weekday() < 5:
+            slot_end = current + duration
+            is_free = True
+            for busy in busy_slots:
+                if max(current, parse(busy["start"])) < min(slot_end, parse(busy["end"])):
+                    is_free = False
+                    break
+            if is_free:
+                available.append(current)
+        current += dt.timedelta(minutes=30)
+    return available
+
+
+def time_sweep(raw, start, end, duration, tz):
+    """Parses, merges and sweeps; returns (seconds, merged busy count, free gaps)."""
+    t0 = time.perf_counter()
+    parsed = [(isoparse(b["start"]), isoparse(b["end"])) for b in raw]
+    merged = merge_intervals(parsed)
+    free = find_free_slots(merged, start, end, duration, tz)
+    return time.perf_counter() - t0, len(merged), free
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=2000, help="busy events per calendar")
+    parser.add_argument("--calendars", type=int, default=3)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--naive-days", type=int, default=14, help="range for the naive comparison (0 to skip)")
+    args = parser.parse_args()
+
+    tz = pytz.timezone("America/New_York")
+    start = tz.localize(dt.datetime(2025, 9, 1))
+    end = start + dt.timedelta(days=args.days)
+    duration = dt.timedelta(minutes=60)
+    raw = synthetic_busy(tz, start, args.days, args.events, args.calendars)
+    print(f"{len(raw)} busy intervals over {args.days} days ({args.calendars} calendars)")
+
+    seconds, merged, free = time_sweep(raw, start, end, duration, tz)
+    print(f"sweep, full range:   {seconds * 1000:9.1f} ms  ({merged} merged busy, {len(free)} free gaps)")
+
+    if args.naive_days:
+        naive_end = start + dt.timedelta(days=args.naive_days)
+        subset = [b for b in raw if b["start"] < naive_end.isoformat()]
+        sweep_seconds, _, free = time_sweep(subset, start, naive_end, duration, tz)
+        t0 = time.perf_counter()
+        slots = naive_free_slots(subset, start, naive_end, duration)
+        naive_seconds = time.perf_counter() - t0
+        print(f"{len(subset)} busy intervals in the first {args.naive_days} days:")
+        print(f"  sweep:             {sweep_seconds * 1000:9.1f} ms  ({len(free)} free gaps)")
+        print(f"  naive:             {naive_seconds * 1000:9.1f} ms  ({len(slots)} free 30-minute starts)")
+        print(f"  speedup:           {naive_seconds / sweep_seconds:9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark: per-call overhead of a fresh ElevenLabs client vs the shared pool.
+
+Runs STT and TTS calls against a local stub server (see stub_servers.py) so
+only client construction and connection setup are measured. Against the real
+API every fresh client also pays a TLS handshake, so the gap is larger there.
+
+    python benchmarks/bench_elevenlabs_clients.py --calls 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from elevenlabs.client import ElevenLabs  # noqa: E402
+from elevenlabs_client import close_elevenlabs_clients, get_elevenlabs_client  # noqa: E402
+from stub_servers import StubElevenLabsServer  # noqa: E402
+
+API_KEY = "stub-key"
+
+
+def one_turn(client):
+    """One voice turn: a transcription followed by a streamed synthesis."""
+    client.speech_to_text.convert(file=BytesIO(b"RIFF" + bytes(2000)), model_id="scribe_v1")
+    for _ in client.text_to_speech.stream(voice_id="stub", text="Done.", model_id="eleven_multilingual_v2"):
+        pass
+
+
+def measure(calls, make_client):
+    timings = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        one_turn(make_client())
+        timings.append((time.perf_counter() - t0) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<14} mean {statistics.mean(timings):7.2f} ms   p50 {statistics.median(timings):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=200, help="voice turns per variant")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub service time in seconds")
+    args = parser.parse_args()
+
+    with StubElevenLabsServer(latency=args.latency) as stub:
+        fresh = measure(args.calls, lambda: ElevenLabs(api_key=API_KEY, base_url=stub.base_url))
+        pooled = measure(args.calls, lambda: get_elevenlabs_client(API_KEY, base_url=stub.base_url))
+        close_elevenlabs_clients()
+
+    print(f"{args.calls} turns (1 STT + 1 TTS each) against {stub.base_url}")
+    report("new client", fresh)
+    report("shared pool", pooled)
+    saved = statistics.mean(fresh) - statistics.mean(pooled)
+    print(f"saved per turn: {saved:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
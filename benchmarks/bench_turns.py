@@ -0,0 +1,289 @@
+"""
+Benchmark: end-to-end voice turns, fully offline and deterministic.
+
+Replays the scripted conversations in a corpus (see corpora/scheduling.json)
+through the real pipeline: audio preprocessing, STT and TTS against the local
+ElevenLabs stub, and SchedulingAgent with its tools, where Gemini is replaced by
+ScriptedChatModel and Google Calendar by FakeCalendarService (see fakes.py).
+Sessions run N at a time; every session gets its own agent and calendar.
+
+With --service, turns are submitted to the async TurnService instead (async
+LLM and ElevenLabs clients); the agent then hears the stub's transcript rather
+than the corpus text, which the scripted LLM ignores anyway.
+
+Reports throughput, turn latency and time-to-first-audio percentiles, per-stage
+percentiles from the tracing spans, prompt and context tokens, and memory per
+turn. --raw-tool-results feeds tool outputs back in the old str() form, to
+measure what the compact tool-result encoding saves; --full-events drops the
+fields= mask from event listings, to measure the bytes it saves.
+
+Calendar requests go through the quota-aware scheduler. Its limits are lifted
+unless --calendar-qps is given, so the numbers measure the code, not the quota;
+--api-error-rate makes the fake Calendar fail transiently to exercise retries.
+
+    python benchmarks/bench_turns.py --concurrency 8 --sessions 48
+    python benchmarks/bench_turns.py --llm-latency 0.4 --api-latency 0.08 --audio-latency 0.3 --stream
+    python benchmarks/bench_turns.py --service --concurrency 64 --sessions 256 --llm-latency 0.4
+    python benchmarks/bench_turns.py --raw-tool-results
+    python benchmarks/bench_turns.py --concurrency 16 --sessions 64 --calendar-qps 20 --api-error-rate 0.05
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from fakes import ApproxTokenizer, FakeCalendarService, ScriptedChatModel  # noqa: E402
+from stub_servers import StubElevenLabsServer  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(BENCH_DIR, "corpora", "scheduling.json")
+BENCH_NOW = "2030-06-01T09:00:00-04:00"  # fixed "current time" for the system prompt
+
+
+def sample_recording(sample_rate=44100):
+    """A mono WAV like the recorder produces: silence, 1.5 s of 'speech', silence."""
+    t = np.arange(int(sample_rate * 1.5)) / sample_rate
+    tone = (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16)
+    silence = np.zeros(sample_rate, dtype=np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.concatenate([silence, tone, silence]).tobytes())
+    return buffer.getvalue()
+
+
+def percentile(values, q):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(-(-len(ordered) * q // 100) - 1, 0)]
+
+
+def run_session(session_id, conversation, corpus, args, env):
+    """Plays one conversation through a fresh agent and calendar; returns per-turn records."""
+    from google.oauth2.credentials import Credentials
+    from agent import SchedulingAgent, TOOLS
+    from audio_preprocessing import preprocess_audio
+    from calenderTool import calendar_session
+    from speech_to_text import transcribe_audio
+    from text_to_speech import generate_tts, stream_tts, TTS_OUTPUT_FORMAT
+    from tracing import span
+    from turn_service import process_voice_turn
+
+    service = FakeCalendarService(
+        events=corpus.get("seed_events", []),
+        timezone=corpus.get("timezone", "America/New_York"),
+        other_calendars=corpus.get("other_calendars"),
+        latency=args.api_latency,
+        error_rate=args.api_error_rate,
+        seed=session_id,
+    )
+    creds = Credentials(token=f"bench-{session_id}", refresh_token=f"bench-refresh-{session_id}", client_id="bench")
+    responses = [response for turn in conversation["turns"] for response in turn["responses"]]
+    llm = ScriptedChatModel(responses, latency=args.llm_latency, tokenizer=env["tokenizer"])
+    agent = SchedulingAgent(
+        tools=TOOLS,
+        system_prompt=env["prompt"],
+        llm=llm,
+        llm_with_tools=llm,
+        tokenizer=env["tokenizer"],
+    )
+
+    records = []
+    if env.get("turn_service") is not None:
+        agents = {session_id: agent}
+        for _ in conversation["turns"]:
+            started = time.perf_counter()
+            first_audio = None
+            prompt_tokens = llm.input_tokens
+            turn = env["turn_service"].submit(
+                session_id, process_voice_turn, session_id, env["recording"], creds,
+                TTS_OUTPUT_FORMAT, args.stream, service, agents,
+            )
+            while True:
+                kind, payload = turn.next_event()
+                if kind == "audio" and first_audio is None:
+                    first_audio = time.perf_counter() - started
+                elif kind == "error":
+                    raise payload
+                elif kind == "done":
+                    break
+            records.append({
+                "latency": time.perf_counter() - started,
+                "first_audio": first_audio,
+                "prompt_tokens": llm.input_tokens - prompt_tokens,
+                "context_tokens": agent._get_token_count(),
+            })
+        return records, agent, service
+
+    with calendar_session(creds, service):
+        for turn in conversation["turns"]:
+            started = time.perf_counter()
+            first_audio = None
+            prompt_tokens = llm.input_tokens
+            with span("voice_turn", session=session_id):
+                speech, _ = preprocess_audio(env["recording"])
+                transcribe_audio(speech)  # the stub's transcript is ignored; the corpus drives the agent
+                if args.stream:
+                    for _, _audio in stream_tts(agent.stream(turn["user"])):
+                        if first_audio is None:
+                            first_audio = time.perf_counter() - started
+                else:
+                    generate_tts(agent.invoke(turn["user"]))
+                    first_audio = time.perf_counter() - started
+            records.append({
+                "latency": time.perf_counter() - started,
+                "first_audio": first_audio,
+                "prompt_tokens": llm.input_tokens - prompt_tokens,
+                "context_tokens": agent._get_token_count(),
+            })
+    return records, agent, service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="conversation corpus (JSON)")
+    parser.add_argument("--sessions", type=int, default=24, help="conversations to replay (cycled from the corpus)")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions running at once")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per scripted LLM call")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds per fake Calendar request")
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="share of Calendar requests failing with 429/503")
+    parser.add_argument("--calendar-qps", type=float, default=0.0,
+                        help="global Calendar request rate for the scheduler (default: unlimited)")
+    parser.add_argument("--audio-latency", type=float, default=0.0, help="stub STT/TTS service time in seconds")
+    parser.add_argument("--stream", action="store_true", help="stream replies sentence by sentence into TTS")
+    parser.add_argument("--service", action="store_true", help="run turns on the async TurnService")
+    parser.add_argument("--full-events", action="store_true", help="list full event resources (no fields= mask)")
+    parser.add_argument("--raw-tool-results", action="store_true", help="feed tool results back unencoded (str())")
+    parser.add_argument("--trace-memory", action="store_true", help="measure allocations with tracemalloc (slower)")
+    parser.add_argument("--tiktoken", action="store_true", help="count tokens with tiktoken instead of an offline estimate")
+    parser.add_argument("--verbose", action="store_true", help="keep the agent's and tools' console output")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+    conversations = corpus["conversations"]
+
+    with StubElevenLabsServer(latency=args.audio_latency) as stub, tempfile.TemporaryDirectory() as cache_dir:
+        # Project modules read these at import time
+        os.environ.update({
+            "ELEVENLABS_API_KEY": "stub-key",
+            "ELEVENLABS_BASE_URL": stub.base_url,
+            "TTS_CACHE_DIR": cache_dir,
+            "TRACE_EXPORT_PATH": os.environ.get("TRACE_EXPORT_PATH", ""),
+            "TOOL_RESULT_FORMAT": "raw" if args.raw_tool_results else "compact",
+            **({"CALENDAR_LIST_FIELDS": ""} if args.full_events else {}),
+            "CALENDAR_GLOBAL_RATE": str(args.calendar_qps or 1e9),
+            "CALENDAR_GLOBAL_BURST": str(int(args.calendar_qps) or 10 ** 9),
+            "CALENDAR_USER_RATE": str(1e9),
+            "CALENDAR_USER_BURST": str(10 ** 9),
+            # Tests retries, not patience
+            "CALENDAR_MAX_QUEUE_SECONDS": "60",
+        })
+        from agent import get_tokenizer
+        from text_to_speech import tts_cache
+        from tracing import reset_trace_stats, trace_stats
+        import tool_results
+        from calendar_scheduler import scheduler
+        # Worker threads have no Streamlit session here; that's expected
+        logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+
+        tokenizer = get_tokenizer() if args.tiktoken else ApproxTokenizer()
+        with open(os.path.join(os.path.dirname(BENCH_DIR), "prompt.txt"), encoding="utf-8") as f:
+            prompt = f.read().replace("{current_datetime_str}", BENCH_NOW)
+        env = {"tokenizer": tokenizer, "prompt": prompt, "recording": sample_recording()}
+        if args.service:
+            from turn_service import TurnService
+            env["turn_service"] = TurnService(per_user=1, max_concurrent=args.concurrency)
+
+        with quiet:
+            # Warm-up: lazy imports, the ElevenLabs connection pool and the TTS cache directory
+            run_session("warmup", conversations[0], corpus, args, env)
+            reset_trace_stats()
+            tool_results.reset_stats()
+            for key in scheduler.stats:
+                scheduler.stats[key] = 0
+
+            if args.trace_memory:
+                tracemalloc.start()
+                baseline = tracemalloc.get_traced_memory()[0]
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="session") as pool:
+                futures = [
+                    pool.submit(run_session, f"s{i}", conversations[i % len(conversations)], corpus, args, env)
+                    for i in range(args.sessions)
+                ]
+                results = [future.result() for future in futures]
+            wall = time.perf_counter() - started
+
+            if args.trace_memory:
+                # Agents are still referenced by `results`, so this is what sessions retain
+                retained, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+    records = [record for session_records, _, _ in results for record in session_records]
+    turns = len(records)
+    latencies = [r["latency"] * 1000 for r in records]
+    first_audio = [r["first_audio"] * 1000 for r in records if r["first_audio"] is not None]
+    tokens = [r["context_tokens"] for r in records]
+    prompt_tokens = [r["prompt_tokens"] for r in records]
+    request_counts = {}
+    response_bytes = sum(service.response_bytes for _, _, service in results)
+    for _, _, service in results:
+        for method, count in service.request_counts.items():
+            request_counts[method] = request_counts.get(method, 0) + count
+
+    print(f"{args.sessions} sessions, {turns} turns, concurrency {args.concurrency}, "
+          f"{'streaming' if args.stream else 'non-streaming'}, {'turn service' if args.service else 'threads'}")
+    print(f"latencies: llm {args.llm_latency * 1000:.0f} ms, calendar {args.api_latency * 1000:.0f} ms, "
+          f"stt/tts {args.audio_latency * 1000:.0f} ms")
+    print(f"wall {wall:.2f} s   throughput {turns / wall:.1f} turns/s")
+    for name, values in (("turn latency", latencies), ("first audio", first_audio)):
+        print(f"{name:<13} p50 {percentile(values, 50):8.1f} ms   p95 {percentile(values, 95):8.1f} ms   "
+              f"p99 {percentile(values, 99):8.1f} ms")
+
+    print("\nper stage:")
+    for row in trace_stats():
+        print(f"  {row['stage']:<40} n={row['count']:<5} p50 {row['p50_ms']:8.1f}  p95 {row['p95_ms']:8.1f}  "
+              f"p99 {row['p99_ms']:8.1f} ms")
+
+    by_method = ", ".join(f"{method.split('.', 1)[-1]} {count}" for method, count in sorted(request_counts.items()))
+    print(f"\ncalendar requests: {sum(request_counts.values())} ({by_method})")
+    print(f"calendar scheduler: {scheduler.stats}")
+    print(f"calendar response bytes: {response_bytes / 1024:.1f} KB, {response_bytes / turns:.0f} B per turn")
+    print(f"tts cache: {tts_cache.stats}")
+    print(f"prompt tokens per turn: mean {sum(prompt_tokens) / turns:.0f}, max {max(prompt_tokens)} "
+          f"(all LLM calls in the turn)")
+    print(f"context tokens per turn: mean {sum(tokens) / turns:.0f}, max {max(tokens)}")
+    encoded = tool_results.stats
+    if encoded["results"]:
+        saved = encoded["raw_tokens"] - encoded["encoded_tokens"]
+        print(f"tool results: {encoded['results']}, ~{encoded['raw_tokens'] / encoded['results']:.0f} tokens raw vs "
+              f"~{encoded['encoded_tokens'] / encoded['results']:.0f} encoded ({saved / max(encoded['raw_tokens'], 1):.0%} "
+              f"smaller, {encoded['truncated']} truncated); "
+              f"{'fed back raw' if args.raw_tool_results else f'~{saved / turns:.0f} tokens saved per turn before resends'}")
+    print(f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    if args.trace_memory:
+        print(f"traced memory: peak {(peak - baseline) / 1e6:.1f} MB, "
+              f"retained {(retained - baseline) / turns / 1024:.1f} KB per turn")
+
+
+if __name__ == "__main__":
+    main()
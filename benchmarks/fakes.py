@@ -0,0 +1,476 @@
+"""
+In-process stand-ins for Gemini and Google Calendar, for offline benchmarks.
+
+ScriptedChatModel plays back a fixed sequence of responses (tool calls or final
+text), so every run of a conversation takes exactly the same path through the
+agent loop. FakeCalendarService keeps events in memory and answers the subset of
+the Calendar v3 API the tools use, with an optional per-request latency and an
+optional rate of transient errors (429 / 503) to exercise retries.
+ApproxTokenizer replaces tiktoken when its encoding can't be downloaded.
+"""
+
+import asyncio
+import copy
+import datetime as dt
+import itertools
+import json
+import random
+import threading
+import time
+
+import httplib2
+from dateutil.parser import isoparse
+from googleapiclient.errors import HttpError
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+SUMMARY_TEXT = "The user is scheduling meetings; no open questions."
+
+
+class ApproxTokenizer:
+    """Roughly one token per four characters, deterministic and offline."""
+
+    def encode(self, text):
+        return range((len(text) + 3) // 4)
+
+
+# --- Scripted LLM ---
+
+class ScriptedChatModel:
+    """
+    Plays back scripted responses in order. Each response is a dict with either
+    "tool_calls" ([{"name", "args"}]) or "text". Calls with a plain string
+    prompt are summarization requests and get a canned summary instead, so
+    background summaries never consume the script.
+    """
+
+    def __init__(self, responses, latency=0.0, stream_chunk_chars=12, tokenizer=None):
+        self.responses = list(responses)
+        self.latency = latency
+        self.stream_chunk_chars = stream_chunk_chars
+        self.tokenizer = tokenizer or ApproxTokenizer()
+        self._cursor = 0
+        self.input_tokens = 0  # prompt tokens across all calls, for per-turn accounting
+        self._call_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def bind_tools(self, tools):
+        return self
+
+    def _next(self):
+        with self._lock:
+            if self._cursor >= len(self.responses):
+                raise RuntimeError(f"Script exhausted after {self._cursor} responses")
+            response = self.responses[self._cursor]
+            self._cursor += 1
+            return response
+
+    def _usage(self, messages, output_text):
+        prompt = messages if isinstance(messages, str) else "".join(str(m.content) for m in messages)
+        input_tokens = len(self.tokenizer.encode(prompt))
+        with self._lock:
+            self.input_tokens += input_tokens
+        output_tokens = len(self.tokenizer.encode(output_text))
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _tool_calls(self, response):
+        return [
+            {"name": call["name"], "args": call.get("args", {}), "id": f"call_{next(self._call_ids)}", "type": "tool_call"}
+            for call in response["tool_calls"]
+        ]
+
+    def invoke(self, messages, **kwargs):
+        time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def ainvoke(self, messages, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+    def _respond(self, messages):
+        if isinstance(messages, str):
+            return AIMessage(content=SUMMARY_TEXT, usage_metadata=self._usage(messages, SUMMARY_TEXT))
+        response = self._next()
+        if "tool_calls" in response:
+            tool_calls = self._tool_calls(response)
+            return AIMessage(content="", tool_calls=tool_calls, usage_metadata=self._usage(messages, str(tool_calls)))
+        return AIMessage(content=response["text"], usage_metadata=self._usage(messages, response["text"]))
+
+    def stream(self, messages, **kwargs):
+        # Time to first chunk is the configured latency; the rest arrives quickly
+        time.sleep(self.latency)
+        yield from self._chunks(messages)
+
+    async def astream(self, messages, **kwargs):
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            yield chunk
+
+    def _chunks(self, messages):
+        response = self._next()
+        if "tool_calls" in response:
+            tool_calls = self._tool_calls(response)
+            yield AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i, "type": "tool_call_chunk"}
+                    for i, call in enumerate(tool_calls)
+                ],
+                usage_metadata=self._usage(messages, str(tool_calls)),
+            )
+            return
+        text = response["text"]
+        for start in range(0, len(text), self.stream_chunk_chars):
+            chunk = text[start:start + self.stream_chunk_chars]
+            last = start + self.stream_chunk_chars >= len(text)
+            yield AIMessageChunk(content=chunk, usage_metadata=self._usage(messages, text) if last else None)
+
+
+# --- In-memory Calendar API ---
+
+class FakeRequest:
+    """Mimics googleapiclient's HttpRequest: nothing happens until execute()."""
+
+    def __init__(self, method_id, method, handler, latency, uri=None, fail=None):
+        self.methodId = method_id
+        self.method = method
+        self.uri = uri
+        self.body = None
+        self._handler = handler
+        self._latency = latency
+        self._fail = fail
+
+    def execute(self):
+        time.sleep(self._latency)
+        if self._fail is not None:
+            self._fail()
+        return self._handler()
+
+
+class FakeBatch:
+    """Mimics BatchHttpRequest: the added requests share one round trip, each with its own result."""
+
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request, callback or self.callback, request_id or str(len(self._requests))))
+
+    def execute(self):
+        with self.service._lock:
+            self.service.request_counts["batch"] = self.service.request_counts.get("batch", 0) + 1
+        time.sleep(self.service.latency)
+        for request, callback, request_id in self._requests:
+            try:
+                self.service._maybe_fail()
+                response, error = request._handler(), None
+            except HttpError as e:
+                response, error = None, e
+            if callback is not None:
+                callback(request_id, response, error)
+
+
+def _http_error(status, reason):
+    """A real HttpError, so the tools' error handling (404, 410) is exercised."""
+    body = json.dumps({"error": {"code": status, "message": reason, "errors": [{"reason": reason}]}})
+    return HttpError(httplib2.Response({"status": status}), body.encode("utf-8"))
+
+
+def _parse_fields(fields):
+    """Parses a partial-response mask like "nextPageToken,items(id,start(dateTime))" into a nested dict."""
+    tree, stack, name = {}, [], ""
+    for char in fields + ",":
+        if char in ",()":
+            name = name.strip()
+            if name:
+                tree[name] = tree.get(name) or {}
+            if char == "(":
+                stack.append(tree)
+                tree = tree[name]
+            elif char == ")":
+                tree = stack.pop()
+            name = ""
+        else:
+            name += char
+    return tree
+
+
+def _apply_fields(value, tree):
+    """Keeps only the masked fields; an empty subtree keeps the whole value. Lists are masked per item."""
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_apply_fields(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _apply_fields(value[key], sub) for key, sub in tree.items() if key in value}
+    return value
+
+
+def _event_bounds(event):
+    start = event["start"].get("dateTime", event["start"].get("date"))
+    end = event["end"].get("dateTime", event["end"].get("date"))
+    start, end = isoparse(start), isoparse(end)
+    if start.tzinfo is None:
+        start, end = start.replace(tzinfo=dt.timezone.utc), end.replace(tzinfo=dt.timezone.utc)
+    return start, end
+
+
+class FakeCalendarService:
+    """
+    One user's calendars. `events` seeds the primary calendar; `other_calendars`
+    maps calendar ids (e.g. attendee emails) to event lists visible to freebusy.
+    """
+
+    def __init__(self, events=(), timezone="America/New_York", other_calendars=None, latency=0.0,
+                 error_rate=0.0, seed=0):
+        self.timezone = timezone
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._version = 0
+        self._events = {}  # id -> event (including cancelled ones)
+        self._versions = {}  # id -> version of the last change
+        self.other_calendars = {cid: [copy.deepcopy(e) for e in evs] for cid, evs in (other_calendars or {}).items()}
+        self.request_counts = {}
+        self.response_bytes = 0  # JSON size of every response, as it would cross the wire
+        for event in events:
+            self._store(copy.deepcopy(event))
+
+    # Resource accessors, as on a googleapiclient service
+    def events(self):
+        return _EventsResource(self)
+
+    def calendars(self):
+        return _CalendarsResource(self)
+
+    def freebusy(self):
+        return _FreebusyResource(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def _maybe_fail(self):
+        """Raises a transient error (rate limit or unavailable) at the configured rate."""
+        with self._lock:
+            roll, status = self._random.random(), self._random.choice((429, 503))
+            if roll >= self.error_rate:
+                return
+            self.request_counts["transient_errors"] = self.request_counts.get("transient_errors", 0) + 1
+        raise _http_error(status, "rateLimitExceeded" if status == 429 else "backendError")
+
+    def _request(self, method_id, method, handler, fields=None, params=None):
+        with self._lock:
+            self.request_counts[method_id] = self.request_counts.get(method_id, 0) + 1
+        mask = _parse_fields(fields) if fields else None
+
+        def respond():
+            result = handler()
+            if mask:
+                result = _apply_fields(result, mask)
+            size = len(json.dumps(result))
+            with self._lock:
+                self.response_bytes += size
+            return result
+
+        uri = f"fake://{method_id}?{json.dumps(params, sort_keys=True, default=str)}" if params is not None else None
+        return FakeRequest(method_id, method, respond, self.latency, uri, self._maybe_fail if self.error_rate else None)
+
+    def _store(self, event):
+        """Saves an event and bumps the change version; called with the lock held."""
+        event.setdefault("id", f"evt{next(self._ids):06d}")
+        event.setdefault("status", "confirmed")
+        self._version += 1
+        # The bookkeeping fields a real event resource carries, so result sizes are realistic
+        event.update({
+            "kind": "calendar#event",
+            "etag": f'"{3400000000000000 + self._version}"',
+            "htmlLink": f"https://www.google.com/calendar/event?eid={event['id']}bench",
+            "created": event.get("created", "2030-05-01T12:00:00.000Z"),
+            "updated": f"v{self._version}",
+            "creator": {"email": "bench.user@example.com", "self": True},
+            "organizer": {"email": "bench.user@example.com", "self": True},
+            "iCalUID": f"{event['id']}@google.com",
+            "sequence": event.get("sequence", -1) + 1,
+            "reminders": {"useDefault": True},
+            "eventType": "default",
+        })
+        self._events[event["id"]] = event
+        self._versions[event["id"]] = self._version
+        return copy.deepcopy(event)
+
+    def _live(self, calendar_id):
+        if calendar_id == "primary":
+            return [e for e in self._events.values() if e["status"] != "cancelled"]
+        if calendar_id in self.other_calendars:
+            return self.other_calendars[calendar_id]
+        raise _http_error(404, "notFound")
+
+
+class _EventsResource:
+    PAGE_SIZE = 250
+
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, calendarId="primary", timeMin=None, timeMax=None, q=None, maxResults=None,
+             orderBy=None, singleEvents=True, syncToken=None, pageToken=None, showDeleted=False, fields=None):
+        service = self.service
+
+        def handler():
+            with service._lock:
+                if syncToken is not None:
+                    since = int(syncToken)
+                    if since > service._version:
+                        raise _http_error(410, "fullSyncRequired")
+                    items = [e for eid, e in service._events.items() if service._versions[eid] > since]
+                else:
+                    items = service._live(calendarId) if not showDeleted else list(service._events.values())
+                    if timeMin or timeMax:
+                        lo = isoparse(timeMin) if timeMin else None
+                        hi = isoparse(timeMax) if timeMax else None
+                        items = [
+                            e for e in items
+                            if (lo is None or _event_bounds(e)[1] > lo) and (hi is None or _event_bounds(e)[0] < hi)
+                        ]
+                    if q:
+                        needle = q.lower()
+                        items = [
+                            e for e in items
+                            if any(needle in str(e.get(field, "")).lower() for field in ("summary", "description", "location"))
+                        ]
+                if orderBy == "startTime":
+                    items = sorted(items, key=lambda e: _event_bounds(e)[0])
+                items = [copy.deepcopy(e) for e in items]
+                version = service._version
+
+            page_size = min(maxResults or self.PAGE_SIZE, self.PAGE_SIZE)
+            offset = int(pageToken or 0)
+            page = items[offset:offset + page_size]
+            result = {"kind": "calendar#events", "timeZone": service.timezone, "items": page}
+            if offset + page_size < len(items):
+                result["nextPageToken"] = str(offset + page_size)
+            elif orderBy is None and q is None:
+                # Like the real API, sync tokens only come with plain listings
+                result["nextSyncToken"] = str(version)
+            return result
+
+        params = {"calendarId": calendarId, "timeMin": timeMin, "timeMax": timeMax, "q": q, "maxResults": maxResults,
+                  "orderBy": orderBy, "syncToken": syncToken, "pageToken": pageToken, "showDeleted": showDeleted,
+                  "fields": fields}
+        return service._request("calendar.events.list", "GET", handler, fields, params)
+
+    def insert(self, calendarId="primary", body=None, **kwargs):
+        service = self.service
+
+        def handler():
+            with service._lock:
+                event = copy.deepcopy(body)
+                event.pop("id", None)
+                return service._store(event)
+
+        return service._request("calendar.events.insert", "POST", handler)
+
+    def get(self, calendarId="primary", eventId=None, **kwargs):
+        service = self.service
+
+        def handler():
+            with service._lock:
+                event = service._events.get(eventId)
+                if event is None or event["status"] == "cancelled":
+                    raise _http_error(404, "notFound")
+                return copy.deepcopy(event)
+
+        return service._request("calendar.events.get", "GET", handler)
+
+    def update(self, calendarId="primary", eventId=None, body=None, **kwargs):
+        service = self.service
+
+        def handler():
+            with service._lock:
+                if eventId not in service._events:
+                    raise _http_error(404, "notFound")
+                event = copy.deepcopy(body)
+                event["id"] = eventId
+                return service._store(event)
+
+        return service._request("calendar.events.update", "PUT", handler)
+
+    def patch(self, calendarId="primary", eventId=None, body=None, **kwargs):
+        service = self.service
+
+        def handler():
+            with service._lock:
+                event = service._events.get(eventId)
+                if event is None or event["status"] == "cancelled":
+                    raise _http_error(404, "notFound")
+                # Patch semantics: nested objects are merged, everything else replaced
+                event = copy.deepcopy(event)
+                for key, value in copy.deepcopy(body).items():
+                    if isinstance(value, dict) and isinstance(event.get(key), dict):
+                        event[key].update(value)
+                    else:
+                        event[key] = value
+                return service._store(event)
+
+        return service._request("calendar.events.patch", "PATCH", handler)
+
+    def delete(self, calendarId="primary", eventId=None, **kwargs):
+        service = self.service
+
+        def handler():
+            with service._lock:
+                event = service._events.get(eventId)
+                if event is None or event["status"] == "cancelled":
+                    raise _http_error(410, "deleted")
+                event = copy.deepcopy(event)
+                event["status"] = "cancelled"
+                service._store(event)
+                return ""
+
+        return service._request("calendar.events.delete", "DELETE", handler)
+
+
+class _CalendarsResource:
+    def __init__(self, service):
+        self.service = service
+
+    def get(self, calendarId="primary", **kwargs):
+        service = self.service
+        return service._request(
+            "calendar.calendars.get", "GET",
+            lambda: {"kind": "calendar#calendar", "id": calendarId, "summary": "Benchmark user",
+                     "timeZone": service.timezone},
+        )
+
+
+class _FreebusyResource:
+    def __init__(self, service):
+        self.service = service
+
+    def query(self, body=None, **kwargs):
+        service = self.service
+
+        def handler():
+            lo, hi = isoparse(body["timeMin"]), isoparse(body["timeMax"])
+            calendars = {}
+            with service._lock:
+                for item in body.get("items", []):
+                    try:
+                        events = service._live(item["id"])
+                    except HttpError:
+                        calendars[item["id"]] = {"busy": [], "errors": [{"domain": "global", "reason": "notFound"}]}
+                        continue
+                    busy = []
+                    for event in events:
+                        start, end = _event_bounds(event)
+                        if start < hi and end > lo and event.get("transparency") != "transparent":
+                            busy.append({"start": start.isoformat(), "end": end.isoformat()})
+                    calendars[item["id"]] = {"busy": sorted(busy, key=lambda b: b["start"])}
+            return {"kind": "calendar#freeBusy", "timeMin": body["timeMin"], "timeMax": body["timeMax"],
+                    "calendars": calendars}
+
+        return service._request("calendar.freebusy.query", "POST", handler)
@@ -0,0 +1,116 @@
+"""
+Import-time profile: what a cold start of app.py pays for before the first render.
+
+Each scenario runs its imports in a fresh interpreter with `python -X importtime`
+and parses the per-module timings it writes to stderr. Scenarios:
+
+  login      the module-level imports of app.py (what every cold start pays)
+  all        every import in app.py, including the lazy ones on the
+             authenticated path (roughly the old eager layout)
+  <module>   any module named with --module, e.g. agent or text_to_speech
+
+    python benchmarks/import_profile.py --top 15
+    python benchmarks/import_profile.py --module agent --module text_to_speech
+"""
+
+import argparse
+import ast
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+
+# "import time:   self [us] | cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _import_statement(node):
+    """Renders an Import/ImportFrom node back to a single source line."""
+    names = ", ".join(alias.name for alias in node.names)
+    if isinstance(node, ast.Import):
+        return f"import {names}"
+    return f"from {'.' * node.level}{node.module or ''} import {names}"
+
+
+def app_imports(include_lazy):
+    """Returns the import statements in app.py, optionally including nested ones."""
+    with open(APP, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    nodes = ast.walk(tree) if include_lazy else tree.body
+    statements = []
+    for node in nodes:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            # `import *` can't be replayed inside a list of statements; import the module instead
+            if isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names):
+                statements.append(f"import {node.module}")
+            else:
+                statements.append(_import_statement(node))
+    return list(dict.fromkeys(statements))
+
+
+def profile(statements):
+    """
+    Runs the statements in a fresh interpreter with -X importtime.
+    Returns (wall_ms, {module: (self_us, cumulative_us, depth)}).
+    """
+    code = "import time; t0 = time.perf_counter()\n" + "\n".join(statements) + \
+        "\nprint((time.perf_counter() - t0) * 1000)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+
+def report(name, statements, runs, top, startup):
+    walls, modules = [], {}
+    for _ in range(runs):
+        wall, modules = profile(statements)
+        walls.append(wall)
+    modules = {module: timing for module, timing in modules.items() if module not in startup}
+    top_level = sorted(
+        ((cumulative, module) for module, (_, cumulative, depth) in modules.items() if depth == 0),
+        reverse=True,
+    )
+    print(f"== {name}: {len(statements)} import statements, {len(modules)} modules loaded")
+    print(f"   wall time  median {statistics.median(walls):8.1f} ms   min {min(walls):8.1f} ms   ({runs} runs)")
+    for cumulative, module in top_level[:top]:
+        print(f"   {cumulative / 1000:8.1f} ms  {module}")
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per scenario")
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    parser.add_argument("--module", action="append", default=[], help="also profile this module")
+    args = parser.parse_args()
+
+    # Modules the interpreter loads on its own (site, encodings, ...) are not ours to save
+    _, startup = profile([])
+    login = report("login (app.py module level)", app_imports(include_lazy=False), args.runs, args.top, startup)
+    everything = report("all (app.py incl. lazy imports)", app_imports(include_lazy=True), args.runs, args.top, startup)
+    for module in args.module:
+        report(module, [f"import {module}"], args.runs, args.top, startup)
+
+    deferred = sorted(set(everything) - set(login))
+    heavy = [name for name in ("firebase_admin", "google_auth_oauthlib", "elevenlabs", "langchain_google_genai",
+                               "tiktoken", "googleapiclient", "streamlit_float") if name in deferred]
+    print(f"deferred off the cold-start path: {len(deferred)} modules, including {', '.join(heavy) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Local HTTP stand-ins for ElevenLabs speech-to-text and text-to-speech.
+
+The server speaks HTTP/1.1 with keep-alive, so it behaves like the real API
+for connection-reuse purposes, and each response can be delayed to simulate
+service time.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A few hundred bytes of fake MP3 audio per TTS request
+FAKE_AUDIO = b"\xff\xfb\x90\x64" + bytes(400)
+
+
+def _handler(latency):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+            time.sleep(latency)
+
+            if self.path.startswith("/v1/speech-to-text"):
+                body = json.dumps({
+                    "language_code": "eng",
+                    "language_probability": 1.0,
+                    "text": "Schedule a meeting with Sarah tomorrow at two.",
+                    "words": [],
+                }).encode("utf-8")
+                content_type = "application/json"
+            elif self.path.startswith("/v1/text-to-speech"):
+                body = FAKE_AUDIO
+                content_type = "audio/mpeg"
+            else:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return StubHandler
+
+
+class StubElevenLabsServer:
+    """Runs the stub on a background thread; use as a context manager."""
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), _handler(latency))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,275 @@
+"""
+Central scheduler for Google Calendar API requests.
+
+Every Calendar request goes through one process-wide scheduler instead of
+calling execute() directly:
+
+- Token buckets: a global bucket keeps the whole process under the project's
+  quota and a per-user bucket keeps one busy user from starving the others.
+  A request waits for a token from both; if that would take longer than
+  CALENDAR_MAX_QUEUE_SECONDS it fails fast with CalendarBusy instead.
+- Retries: rate limits (429, 403 rateLimitExceeded/userRateLimitExceeded),
+  5xx responses and dropped connections are retried with full-jitter
+  exponential backoff, honouring Retry-After. Inserts are only retried when
+  rate limited, since a 5xx or timeout may have created the event already.
+- Deduplication: identical reads from the same user that are in flight at the
+  same time (two tabs, parallel tool calls) share one HTTP request.
+- Metrics: time spent waiting for tokens and time spent in the API are kept as
+  "calendar.queue_wait" and "calendar.service" stage stats (see tracing), next
+  to counters in scheduler.stats.
+"""
+
+import copy
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from googleapiclient.errors import HttpError
+
+from tracing import record_duration
+
+CALENDAR_GLOBAL_RATE = float(os.getenv("CALENDAR_GLOBAL_RATE", "50"))  # requests per second, all users
+CALENDAR_GLOBAL_BURST = int(os.getenv("CALENDAR_GLOBAL_BURST", "100"))
+CALENDAR_USER_RATE = float(os.getenv("CALENDAR_USER_RATE", "5"))  # requests per second, per user
+CALENDAR_USER_BURST = int(os.getenv("CALENDAR_USER_BURST", "20"))
+CALENDAR_MAX_QUEUE_SECONDS = float(os.getenv("CALENDAR_MAX_QUEUE_SECONDS", "10"))
+CALENDAR_MAX_RETRIES = int(os.getenv("CALENDAR_MAX_RETRIES", "4"))
+CALENDAR_BACKOFF_BASE_SECONDS = 0.5
+CALENDAR_BACKOFF_MAX_SECONDS = 16.0
+USER_BUCKETS_MAX = 1024
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+READ_ONLY_POSTS = {"calendar.freebusy.query"}  # POSTs that don't change anything
+
+
+class CalendarBusy(Exception):
+    """Raised when a request would have to wait too long for quota."""
+
+
+class TokenBucket:
+    """Refills at `rate` tokens per second up to `capacity`. Reservations may run the balance negative."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, cost=1, max_wait=None):
+        """
+        Takes cost tokens and returns how long to wait before using them, or None
+        (taking nothing) if that wait would exceed max_wait.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            wait = max(cost - self.tokens, 0) / self.rate
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.tokens -= cost
+            return wait
+
+    def refund(self, cost=1):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + cost)
+
+
+def _error_reasons(error):
+    try:
+        details = json.loads(error.content.decode("utf-8"))["error"]
+        return {item.get("reason") for item in details.get("errors", [])}
+    except (ValueError, KeyError, AttributeError, TypeError):
+        return set()
+
+
+def _is_rate_limited(error):
+    return isinstance(error, HttpError) and (
+        error.resp.status == 429 or (error.resp.status == 403 and bool(_error_reasons(error) & RATE_LIMIT_REASONS))
+    )
+
+
+def is_retryable(error, method="GET"):
+    """True if a failed request may be sent again."""
+    if _is_rate_limited(error):
+        return True
+    if method == "POST":
+        # The insert may have gone through before the failure
+        return False
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, if it said."""
+    if isinstance(error, HttpError):
+        try:
+            return float(error.resp.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+class CalendarScheduler:
+    """Throttles, retries and deduplicates Calendar requests; see the module docstring."""
+
+    def __init__(self, global_rate=CALENDAR_GLOBAL_RATE, global_burst=CALENDAR_GLOBAL_BURST,
+                 user_rate=CALENDAR_USER_RATE, user_burst=CALENDAR_USER_BURST,
+                 max_queue_seconds=CALENDAR_MAX_QUEUE_SECONDS, max_retries=CALENDAR_MAX_RETRIES,
+                 backoff_base=CALENDAR_BACKOFF_BASE_SECONDS, backoff_max=CALENDAR_BACKOFF_MAX_SECONDS):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_queue_seconds = max_queue_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._user_buckets = {}  # user key -> TokenBucket, oldest first
+        self._in_flight = {}  # dedup key -> Future
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "deduplicated": 0, "throttled": 0, "retries": 0, "rejected": 0, "failed": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _user_bucket(self, user_key):
+        with self._lock:
+            bucket = self._user_buckets.pop(user_key, None)
+            if bucket is None:
+                bucket = TokenBucket(self.user_rate, self.user_burst)
+                if len(self._user_buckets) >= USER_BUCKETS_MAX:
+                    self._user_buckets.pop(next(iter(self._user_buckets)))
+            self._user_buckets[user_key] = bucket  # re-inserted: most recently used last
+            return bucket
+
+    def _acquire(self, user_key, cost):
+        """Waits until both buckets allow cost more requests. Raises CalendarBusy if that's too far off."""
+        user_bucket = self._user_bucket(user_key)
+        user_wait = user_bucket.reserve(cost, self.max_queue_seconds)
+        global_wait = None if user_wait is None else self.global_bucket.reserve(cost, self.max_queue_seconds)
+        if global_wait is None:
+            if user_wait is not None:
+                user_bucket.refund(cost)
+            self._count("rejected")
+            raise CalendarBusy("Google Calendar is busy right now; please try again in a few seconds.")
+        wait = max(user_wait, global_wait)
+        if wait > 0:
+            self._count("throttled")
+            time.sleep(wait)
+        record_duration("calendar.queue_wait", wait * 1000)
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, _retry_after(error) or 0)
+
+    def call(self, user_key, send, cost=1, method="GET", span=None):
+        """
+        Runs send() once quota allows, retrying retryable failures. cost is how many
+        API requests send() makes (a batch counts each of its parts).
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire(user_key, cost)
+            started = time.perf_counter()
+            try:
+                result = send()
+            except Exception as e:
+                record_duration("calendar.service", (time.perf_counter() - started) * 1000)
+                if attempt == self.max_retries or not is_retryable(e, method):
+                    self._count("failed")
+                    raise
+                delay = self._backoff(attempt, e)
+                self._count("retries")
+                print(f"Calendar request failed ({e}); retry {attempt + 1} in {delay:.1f}s")
+                if span is not None:
+                    span.set(retries=attempt + 1)
+                time.sleep(delay)
+                continue
+            record_duration("calendar.service", (time.perf_counter() - started) * 1000)
+            return result
+
+    def execute(self, request, user_key, span=None):
+        """Executes one googleapiclient request under the scheduler."""
+        self._count("requests")
+        key = None
+        uri = getattr(request, "uri", None)
+        if uri and (request.method == "GET" or request.methodId in READ_ONLY_POSTS):
+            key = (user_key, request.methodId, uri, getattr(request, "body", None))
+        if key is None:
+            return self.call(user_key, request.execute, method=request.method, span=span)
+
+        with self._lock:
+            leader = self._in_flight.get(key)
+            if leader is None:
+                future = self._in_flight[key] = Future()
+        if leader is not None:
+            self._count("deduplicated")
+            if span is not None:
+                span.set(deduplicated=True)
+            # Callers may modify what they get back, so followers get their own copy
+            return copy.deepcopy(leader.result())
+        try:
+            result = self.call(user_key, request.execute, method=request.method, span=span)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def execute_batch(self, service, requests, user_key, chunk_size, span=None):
+        """
+        Sends requests through service.new_batch_http_request, chunk_size at a
+        time. Parts that fail with a retryable error are resent in a later batch
+        after a backoff. A chunk holding an insert is only resent as a whole when
+        rate limited; if the batch itself fails, each of its parts gets that
+        error. Returns one (response, error) pair per request, in order.
+        """
+        results = [None] * len(requests)
+
+        def collect(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        self._count("requests", len(requests))
+        pending = list(range(len(requests)))
+        for attempt in range(self.max_retries + 1):
+            for offset in range(0, len(pending), chunk_size):
+                chunk = pending[offset:offset + chunk_size]
+                batch = service.new_batch_http_request(callback=collect)
+                for index in chunk:
+                    batch.add(requests[index], request_id=str(index))
+                # Same rule as single requests: an insert may already have gone through
+                method = "POST" if any(requests[index].method == "POST" for index in chunk) else "GET"
+                try:
+                    self.call(user_key, batch.execute, cost=len(chunk), method=method, span=span)
+                except Exception as e:
+                    for index in chunk:
+                        if results[index] is None or results[index][1] is not None:
+                            results[index] = (None, e)
+            retry = [
+                index for index in pending
+                if results[index][1] is not None and is_retryable(results[index][1], requests[index].method)
+            ]
+            if not retry or attempt == self.max_retries:
+                break
+            self._count("retries", len(retry))
+            if span is not None:
+                span.set(retried_parts=len(retry))
+            time.sleep(max(self._backoff(attempt, results[index][1]) for index in retry))
+            pending = retry
+        self._count("failed", sum(1 for _, error in results if error is not None))
+        return results
+
+
+# Shared by every session in the process, like the quota it guards
+scheduler = CalendarScheduler()
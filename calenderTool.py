@@ -1,37 +1,367 @@
 import datetime as dt
 import os.path
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List
+from typing_extensions import Required, TypedDict
 from langchain_core.tools import tool
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+import google_auth_httplib2
+import httplib2
 import random
 import pytz
 from dateutil.parser import parse # Helps parse "2 PM tomorrow"
 import streamlit as st
+from event_cache import get_event_cache, drop_event_cache, is_confident_match
+from availability import (find_free_slots, query_busy, parse_working_days, parse_working_hours,
+                          BUFFER_MINUTES, WORKING_DAYS, WORKING_HOURS)
+from tracing import span
+from calendar_scheduler import scheduler
+from tool_results import encode_batch, encode_event, encode_events, encode_slots, format_event
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
-def get_calendar_service():
+# --- Calendar Service Cache ---
+# Building a service object parses the whole discovery document, so we keep one
+# service per set of credentials and reuse it across tool calls.
+SERVICE_CACHE_TTL_SECONDS = 30 * 60
+SERVICE_CACHE_MAX_SIZE = 64
+
+_service_cache = OrderedDict()  # credentials key -> (service, credentials, built_at)
+_service_cache_lock = threading.Lock()
+_discovery_document = None
+
+
+def _load_discovery_document():
+    """Loads the Calendar v3 discovery document bundled with googleapiclient (no network)."""
+    global _discovery_document
+    if _discovery_document is None:
+        doc = get_static_doc('calendar', 'v3')
+        _discovery_document = json.loads(doc) if doc else None
+    return _discovery_document
+
+
+def _credentials_key(creds):
+    """Returns a stable cache key for a user's credentials."""
+    # The refresh token outlives individual access tokens, so it identifies the grant.
+    secret = creds.refresh_token or creds.token or ''
+    return hashlib.sha256(f"{creds.client_id}:{secret}".encode("utf-8")).hexdigest()
+
+
+_thread_local = threading.local()
+
+
+def _thread_http():
+    """
+    Returns this thread's httplib2.Http. httplib2 is not thread-safe, so a cached
+    service shared by parallel tool calls gives every thread its own connections.
+    """
+    http = getattr(_thread_local, 'http', None)
+    if http is None:
+        http = _thread_local.http = httplib2.Http()
+    return http
+
+
+def _build_calendar_service(creds):
+    """Builds a Calendar service, preferring the bundled discovery document."""
+    def build_request(http, *args, **kwargs):
+        authed_http = google_auth_httplib2.AuthorizedHttp(creds, http=_thread_http())
+        return HttpRequest(authed_http, *args, **kwargs)
+
+    authed_http = google_auth_httplib2.AuthorizedHttp(creds, http=_thread_http())
+    discovery_doc = _load_discovery_document()
+    if discovery_doc is not None:
+        return build_from_document(discovery_doc, http=authed_http, requestBuilder=build_request)
+    return build(
+        'calendar', 'v3', http=authed_http, requestBuilder=build_request,
+        static_discovery=True, cache_discovery=False,
+    )
+
+
+def invalidate_calendar_service(creds=None):
     """
-    Builds and returns an authorized Google Calendar service object.
-    Checks st.session_state for credentials.
-    Returns None if credentials are not available.
+    Drops the cached service for the given credentials, or every cached service
+    when called without arguments (e.g. on logout).
     """
+    with _service_cache_lock:
+        if creds is None:
+            _service_cache.clear()
+        else:
+            _service_cache.pop(_credentials_key(creds), None)
+
+
+# Set by calendar_session() for code running outside a Streamlit session
+# (background workers, benchmarks); tool threads inherit it via copied contexts.
+_session_override = contextvars.ContextVar("calendar_session", default=None)
+
+
+@contextmanager
+def calendar_session(creds, service=None):
+    """
+    Makes the tools act for creds instead of st.session_state within the block.
+    A ready service (e.g. an in-memory fake) can be passed to skip building one.
+    """
+    token = _session_override.set((creds, service))
+    try:
+        yield
+    finally:
+        _session_override.reset(token)
+
+
+def _current_credentials():
+    """Returns the credentials of the current session or raises if not logged in."""
+    override = _session_override.get()
+    if override is not None:
+        return override[0]
     if 'credentials' not in st.session_state or not st.session_state['credentials']:
         st.error("Authentication required. Please log in to connect to Google Calendar.")
         raise Exception("No credentials in session state.")
-    
+    return st.session_state['credentials']
+
+
+def get_calendar_service():
+    """
+    Returns an authorized Google Calendar service object for the current session.
+    Checks st.session_state for credentials and reuses a cached service when possible.
+    Raises if credentials are not available.
+    """
+    override = _session_override.get()
+    if override is not None and override[1] is not None:
+        return override[1]
+    creds = _current_credentials()
+    key = _credentials_key(creds)
+    now = time.monotonic()
+
+    with _service_cache_lock:
+        entry = _service_cache.get(key)
+        if entry is not None:
+            service, cached_creds, built_at = entry
+            expired = now - built_at > SERVICE_CACHE_TTL_SECONDS
+            # A different credentials object with a different access token means
+            # the token was refreshed (or re-issued) outside the cached service.
+            refreshed = cached_creds is not creds and cached_creds.token != creds.token
+            if not expired and not refreshed:
+                _service_cache.move_to_end(key)
+                return service
+            del _service_cache[key]
+
     try:
-        # Build the service object from the credentials in session state
-        service = build('calendar', 'v3', credentials=st.session_state['credentials'])
-        return service
+        service = _build_calendar_service(creds)
     except Exception as e:
         st.error(f"Failed to create Google Calendar service: {e}")
         raise
 
+    with _service_cache_lock:
+        _service_cache[key] = (service, creds, now)
+        _service_cache.move_to_end(key)
+        while len(_service_cache) > SERVICE_CACHE_MAX_SIZE:
+            _service_cache.popitem(last=False)
+    return service
+
+
+def _execute_request(request):
+    """
+    Executes a Google API request through the quota-aware scheduler (throttling,
+    retries, deduplication) inside a trace span named after its API method.
+    """
+    with span(f"google.{request.methodId}", method=request.method) as request_span:
+        response = scheduler.execute(request, _credentials_key(_current_credentials()), span=request_span)
+        if isinstance(response, dict) and 'items' in response:
+            request_span.set(items=len(response['items']))
+        return response
+
+
+# --- Event Listing ---
+# Only the fields the tools and the event cache read are requested, which keeps
+# responses small on busy calendars. Cancelled events (seen by incremental
+# syncs) come back with just their id and status. CALENDAR_LIST_FIELDS=""
+# requests full resources instead.
+EVENT_FIELDS = "id,status,summary,description,location,start,end,attendees(email,self),recurringEventId,recurrence"
+EVENT_LIST_FIELDS = os.getenv("CALENDAR_LIST_FIELDS", f"nextPageToken,nextSyncToken,items({EVENT_FIELDS})")
+EVENT_LIST_PAGE_SIZE = 250  # the API's default; the maximum is 2500
+
+
+class EventListing:
+    """
+    Lazily pages through events().list. Iterating yields events one at a time and
+    requests the next page only when the previous one is used up, so a caller
+    that stops early (or sets limit) never fetches the rest. Once fully consumed,
+    sync_token holds the listing's nextSyncToken (the API only hands one out on the
+    last page). page_request() builds a single page's request, e.g. for a batch.
+    """
+
+    def __init__(self, service, fields=EVENT_LIST_FIELDS, page_size=EVENT_LIST_PAGE_SIZE, limit=None, **params):
+        self.service = service
+        self.limit = limit
+        self.params = dict(params, maxResults=min(page_size, limit) if limit else page_size)
+        if fields:
+            self.params['fields'] = fields
+        self.params.setdefault('calendarId', 'primary')
+        self.params.setdefault('singleEvents', True)
+        self.sync_token = None
+        self.pages = 0
+
+    def page_request(self, page_token=None):
+        """The events().list request for one page of this listing."""
+        return self.service.events().list(pageToken=page_token, **self.params)
+
+    def __iter__(self):
+        page_token = None
+        remaining = self.limit
+        while True:
+            result = _execute_request(self.page_request(page_token))
+            self.pages += 1
+            items = result.get('items', [])
+            if remaining is not None:
+                items = items[:remaining]
+                remaining -= len(items)
+            yield from items
+            page_token = result.get('nextPageToken')
+            if remaining == 0:
+                return
+            if not page_token:
+                self.sync_token = result.get('nextSyncToken')
+                return
+
+
+# --- Calendar Metadata Cache ---
+# Every tool needs the calendar's time zone. It rarely changes, so we fetch the
+# calendar resource once per user/calendar and refresh it periodically.
+CALENDAR_METADATA_REFRESH_SECONDS = 60 * 60
+
+_calendar_metadata = {}  # (credentials key, calendar id) -> metadata dict
+_calendar_metadata_lock = threading.Lock()
+_calendar_metadata_stats = {'hits': 0, 'misses': 0}
+
+
+def get_calendar_metadata(service, calendar_id='primary', force_refresh=False):
+    """
+    Returns cached metadata for a calendar: its time zone name, the resolved
+    pytz time zone, summary and a few other settings.
+    Pass force_refresh=True to bypass the cache and re-fetch from the API.
+    """
+    key = (_credentials_key(_current_credentials()), calendar_id)
+    now = time.monotonic()
+
+    with _calendar_metadata_lock:
+        metadata = _calendar_metadata.get(key)
+        if (
+            metadata is not None
+            and not force_refresh
+            and now - metadata['fetched_at'] <= CALENDAR_METADATA_REFRESH_SECONDS
+        ):
+            _calendar_metadata_stats['hits'] += 1
+            return metadata
+        _calendar_metadata_stats['misses'] += 1
+
+    calendar_info = _execute_request(service.calendars().get(calendarId=calendar_id))
+    timezone_str = calendar_info['timeZone']
+    metadata = {
+        'calendar_id': calendar_info.get('id', calendar_id),
+        'summary': calendar_info.get('summary'),
+        'time_zone': timezone_str,
+        'tz': pytz.timezone(timezone_str),
+        'location': calendar_info.get('location'),
+        'fetched_at': now,
+    }
+    with _calendar_metadata_lock:
+        _calendar_metadata[key] = metadata
+    return metadata
+
+
+def get_calendar_timezone(service, calendar_id='primary'):
+    """Returns the calendar's time zone as a (name, pytz timezone) tuple."""
+    metadata = get_calendar_metadata(service, calendar_id)
+    return metadata['time_zone'], metadata['tz']
+
+
+def invalidate_calendar_metadata(creds=None, calendar_id=None):
+    """
+    Forces the next lookup to re-fetch calendar metadata. Without arguments the
+    whole cache is cleared; otherwise only entries for the given credentials
+    (and calendar, if provided) are dropped.
+    """
+    with _calendar_metadata_lock:
+        if creds is None:
+            _calendar_metadata.clear()
+            return
+        user_key = _credentials_key(creds)
+        for key in list(_calendar_metadata):
+            if key[0] == user_key and (calendar_id is None or key[1] == calendar_id):
+                del _calendar_metadata[key]
+
+
+def get_calendar_metadata_stats():
+    """Returns cache counters; every hit is one calendars().get round trip saved."""
+    with _calendar_metadata_lock:
+        stats = dict(_calendar_metadata_stats)
+    stats['round_trips_saved'] = stats['hits']
+    return stats
+
+
+# --- Event Cache ---
+
+def _get_event_cache(service):
+    """Returns the current user's event cache."""
+    _, user_timezone = get_calendar_timezone(service)
+    return get_event_cache(_credentials_key(_current_credentials()), user_timezone)
+
+
+def invalidate_event_cache(creds=None):
+    """Drops cached events for the given credentials, or for everyone."""
+    drop_event_cache(_credentials_key(creds) if creds is not None else None)
+
+
+def _sync_event_cache(service, cache):
+    """
+    Refreshes a stale cache with an incremental syncToken list. Returns False if
+    there's no token or the server rejected it (410 Gone), so the caller re-fetches.
+    """
+    if not cache.sync_token:
+        return False
+    listing = EventListing(service, syncToken=cache.sync_token)
+    try:
+        changed = list(listing)
+    except HttpError as error:
+        if error.resp.status == 410:
+            cache.invalidate()
+            return False
+        raise
+    cache.apply_changes(changed, listing.sync_token)
+    return True
+
+
+def _list_events_cached(service, start, end):
+    """
+    Returns events overlapping [start, end) sorted by start time, answered from
+    the event cache when already-fetched windows cover the range.
+    """
+    cache = _get_event_cache(service)
+    events = cache.query(start, end)
+    if events is None and cache.covers(start, end, fresh=False) and _sync_event_cache(service, cache):
+        events = cache.query(start, end)
+    if events is not None:
+        return events
+
+    # No orderBy: the API only hands out a syncToken for unordered listings.
+    # The window is only cached once every page has been read.
+    listing = EventListing(service, timeMin=start.isoformat(), timeMax=end.isoformat())
+    events = list(listing)
+    cache.store(start, end, events, listing.sync_token)
+    return cache.query(start, end) or []
+
 @tool
 def get_events_between_start_and_end(start_time, end_time):
     '''Fetches calendar events within a specified time range.
@@ -41,44 +371,21 @@ def get_events_between_start_and_end(start_time, end_time):
         end_time (str): The end time for the event search (in this YYYY-MM-DDTHH:MM:SS format).
 
     Returns:
-        str: A string representation of a list of dictionaries, where each dictionary contains the start time, end time, and summary of an event.
+        str: One line per event with its time, title, location and attendees, or a message if there are none.
     '''
     service = get_calendar_service()
     try:
         
-        calendar_info = service.calendars().get(calendarId='primary').execute()
-        timezone_str = calendar_info['timeZone']
-        user_timezone = pytz.timezone(timezone_str)
+        timezone_str, user_timezone = get_calendar_timezone(service)
         st = parse(start_time)
-        local_datetime = user_timezone.localize(st)
-        start_time = local_datetime.isoformat()
+        start_datetime = user_timezone.localize(st)
         et = parse(end_time)
-        local_datetime = user_timezone.localize(et)
-        end_time = local_datetime.isoformat()
-        events_result = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=start_time,
-                timeMax=end_time,
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
+        end_datetime = user_timezone.localize(et)
+        events = _list_events_cached(service, start_datetime, end_datetime)
+        return encode_events(
+            "get_events_between_start_and_end", events, user_timezone,
+            f"No events between {start_time} and {end_time}.",
         )
-        events = events_result.get("items", [])
-
-        if not events:
-            print("No upcoming events found.")
-            return
-    # Prints the start and name of the next 10 events
-        result = []
-        for event in events:
-            start = event["start"].get("dateTime", event["start"].get("date"))
-            end = event["end"].get("dateTime", event["end"].get("date"))
-            result.append({'start_time': start, 'end_time': end, 'summary': event["summary"]})
-        result = str(result)
-        return result
 
     except HttpError as error:
         print(f"An error occurred: {error}")
@@ -97,42 +404,17 @@ def set_calender_event(start_time, end_time, summary = None, location = None, de
         attendees (list, optional): A list of dictionaries, each containing the email of an attendee. Defaults to [].
 
     Returns:
-        None: The function prints the HTML link of the created event or an error message.
+        str: A one-line confirmation of the created event, or an error message.
     '''
     service = get_calendar_service()
     try:
-        calendar_info = service.calendars().get(calendarId='primary').execute()
-        timezone_str = calendar_info['timeZone']
-        user_timezone = pytz.timezone(timezone_str)
-        st = parse(start_time)
-        local_datetime = user_timezone.localize(st)
-        start_time = local_datetime.isoformat()
-        et = parse(end_time)
-        local_datetime = user_timezone.localize(et)
-        end_time = local_datetime.isoformat()
-        # user_timezone = pytz.timezone(timezone_str)
-
-        color = random.randint(1, 11)
-
-        event = {
-            'summary': summary,
-            'location': location,
-            'description': description,
-            'colorId': color,
-            'start': {
-                'dateTime': start_time,
-                'timeZone': timezone_str,
-            },
-            'end': {
-                'dateTime': end_time,
-                'timeZone': timezone_str,
-            },
-            'recurrence': recurrence,
-            'attendees': attendees
-        }
-
-        event = service.events().insert(calendarId='primary', body=event).execute()
+        timezone_str, user_timezone = get_calendar_timezone(service)
+        event = _new_event_body(timezone_str, user_timezone, start_time, end_time, summary, location,
+                                description, recurrence, attendees)
+        event = _execute_request(service.events().insert(calendarId='primary', body=event))
+        _get_event_cache(service).upsert(event)
         print(f"Event created: {event.get('htmlLink')}")
+        return f"Event created: {format_event(event, user_timezone)}"
 
     except HttpError as error:
         print(f"An error occurred in creating the event: {error}")
@@ -143,42 +425,29 @@ def find_event_by_name(
     event_name: str, 
 ):
     """
-    Finds a specific event by name in the Google Calendar.
+    Finds a specific event by name in the Google Calendar. The name may be
+    approximate (e.g. "the dentist thing" or "sync with Sarah").
 
     Args:
         event_name (str): The name of the event to find.
 
     Returns:
-        list[str]: A list of up to 5 suggested available time slots in ISO format.
-                   Returns an error string if the event is not found.
+        str: The best match's time, title, location, attendees, description and
+             event_id, plus other close matches with their event_ids.
+             Returns an error string if the event is not found.
     """
     try:
         # service = login_calender()
         service = get_calendar_service()
 
         # Get the calendar's timezone
-        calendar_info = service.calendars().get(calendarId='primary').execute()
-        timezone_str = calendar_info['timeZone']
-        user_timezone = pytz.timezone(timezone_str)
-
-        # 1. Find the anchor event
-        now = dt.datetime.now(user_timezone)
-        events_result = service.events().list(
-            calendarId='primary', 
-            timeMin=now.isoformat(),
-            q=event_name, # Search for the event by name
-            maxResults=1, 
-            singleEvents=True, 
-            orderBy='startTime'
-        ).execute()
-        
-        anchor_event = events_result.get('items', [])
-        if not anchor_event:
+        timezone_str, user_timezone = get_calendar_timezone(service)
+
+        matches = _match_upcoming_events(service, [event_name])[event_name]
+        if not matches:
             return f"Error: Event '{event_name}' not found in your upcoming calendar."
-        return f"found event {anchor_event}"
-        # Get the end time of the anchor event and parse it
-        # end_time_str = anchor_event[0]['end'].get('dateTime', anchor_event[0]['end'].get('date'))
-        # anchor_event_end = dt.datetime.fromisoformat(end_time_str)
+        return encode_event("find_event_by_name", matches[0][1], user_timezone,
+                            alternatives=[event for _, event in matches[1:]])
     except Exception as e:
         return f"Error during authentication or fetching events: {e}"
 
@@ -186,93 +455,145 @@ def find_event_by_name(
 def get_current_date_time():
     """Returns the current date and time in ISO format. Helps to reference what amboiguous times(like 'tomorrow' , 'today' etc) mean."""
     service = get_calendar_service()
-    calendar_info = service.calendars().get(calendarId='primary').execute()
-    timezone_str = calendar_info['timeZone']
-    user_timezone = pytz.timezone(timezone_str)
+    timezone_str, user_timezone = get_calendar_timezone(service)
     print(f"Calendar timezone: {type(user_timezone)}")
     return dt.datetime.now(user_timezone).isoformat()
 
-# @tool
-# def get_free_availability(start_time: str, end_time: str):
-#     """
-#     Finds free time slots in the calendar within a given time range, assuming work hours are 9 AM to 5 PM.
-
-#     Args:
-#         start_time (str): The start of the date range to check for availability (e.g., 'today', 'tomorrow', '2025-09-10').
-#         end_time (str): The end of the date range to check for availability (e.g., 'today', 'tomorrow', '2025-09-10').
-
-#     Returns:
-#         str: A string listing available 1-hour slots or a message indicating no availability.
-#     """
-#     service = get_calendar_service()
-#     try:
-#         calendar_info = service.calendars().get(calendarId='primary').execute()
-#         timezone_str = calendar_info['timeZone']
-#         user_timezone = pytz.timezone(timezone_str)
-
-#         # Parse start and end times and set them to the working hours for those days
-#         start_dt = parse(start_time).astimezone(user_timezone).replace(hour=9, minute=0, second=0, microsecond=0)
-#         end_dt = parse(end_time).astimezone(user_timezone).replace(hour=17, minute=0, second=0, microsecond=0)
-
-#         body = {
-#             "timeMin": start_dt.isoformat(),
-#             "timeMax": end_dt.isoformat(),
-#             "timeZone": timezone_str,
-#             "items": [{"id": "primary"}]
-#         }
-
-#         free_busy_result = service.freebusy().query(body=body).execute()
-#         busy_slots = free_busy_result.get('calendars', {}).get('primary', {}).get('busy', [])
-
-#         if not busy_slots:
-#             return f"The entire time from {start_dt.strftime('%I:%M %p')} to {end_dt.strftime('%I:%M %p')} is free."
-
-#         # Generate potential 1-hour slots and check against busy slots
-#         available_slots = []
-#         current_time = start_dt
-#         while current_time < end_dt:
-#             slot_end = current_time + dt.timedelta(hours=1)
-#             is_free = True
-#             for busy in busy_slots:
-#                 busy_start = parse(busy['start'])
-#                 busy_end = parse(busy['end'])
-#                 # Check for overlap
-#                 if max(current_time, busy_start) < min(slot_end, busy_end):
-#                     is_free = False
-#                     break
-            
-#             if is_free:
-#                 available_slots.append(current_time.strftime('%Y-%m-%d %I:%M %p'))
-            
-#             current_time += dt.timedelta(minutes=30) # Check every half hour for a new potential slot
-
-#         if not available_slots:
-#             return "No 1-hour slots are available in the specified range."
-        
-#         return "The following 1-hour slots are available: " + ", ".join(list(set(available_slots)))
-
-#     except Exception as e:
-#         return f"An error occurred while checking availability: {e}"
-
-
-def _find_event_id(service, event_name_query: str):
-    """Internal helper function to find an event's ID by its name."""
-    now = dt.datetime.utcnow().isoformat() + 'Z'
-    events_result = service.events().list(
-        calendarId='primary',
-        q=event_name_query,
-        timeMin=now,
-        maxResults=1,
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
-    events = events_result.get('items', [])
-    if not events:
-        return None
-    return events[0]['id']
+@tool
+def get_free_availability(start_time: str, end_time: str, duration_minutes: int = 60, attendees: list = None,
+                          working_hours: str = None, working_days: str = None, buffer_minutes: int = None):
+    """
+    Finds free time slots between start_time and end_time within working hours,
+    for the user and optionally other attendees. Unless overridden, working hours
+    are the app's defaults (normally 9 AM to 5 PM, Monday to Friday, no buffer).
+
+    Args:
+        start_time (str): The start of the range to check (in this YYYY-MM-DDTHH:MM:SS format).
+        end_time (str): The end of the range to check (in this YYYY-MM-DDTHH:MM:SS format).
+        duration_minutes (int, optional): The minimum length of a free slot in minutes. Defaults to 60.
+        attendees (list, optional): Email addresses whose calendars must also be free. Defaults to None.
+        working_hours (str, optional): Hours to search within each day, e.g. '08:00-18:00'.
+        working_days (str, optional): Days to search, e.g. 'mon-fri', 'mon,wed,fri' or 'mon-sun'.
+        buffer_minutes (int, optional): Minutes to keep free before and after every busy event.
+
+    Returns:
+        str: The free time ranges that fit the requested duration, or a message indicating no availability.
+    """
+    service = get_calendar_service()
+    try:
+        timezone_str, user_timezone = get_calendar_timezone(service)
+        start_dt = _parse_local_time(start_time, user_timezone)
+        end_dt = _parse_local_time(end_time, user_timezone)
+        duration = dt.timedelta(minutes=int(duration_minutes))
+        hours = parse_working_hours(working_hours) if working_hours else WORKING_HOURS
+        days = parse_working_days(working_days) if working_days else WORKING_DAYS
+        buffer = dt.timedelta(minutes=int(BUFFER_MINUTES if buffer_minutes is None else buffer_minutes))
+
+        calendar_ids = ['primary'] + list(attendees or [])
+        busy, errors = query_busy(service, calendar_ids, start_dt, end_dt, timezone_str, execute=_execute_request)
+        free = find_free_slots(busy, start_dt, end_dt, duration, user_timezone, hours, days, buffer)
+
+        notes = ""
+        if errors:
+            notes = f" (could not read the calendars of: {', '.join(errors)})"
+        if not free:
+            return f"No {duration_minutes}-minute slots are available in the specified range{notes}."
+        slots = [
+            f"{slot_start.strftime('%Y-%m-%d %I:%M %p')} - {slot_end.strftime('%I:%M %p')}"
+            for slot_start, slot_end in free
+        ]
+        return encode_slots("get_free_availability", f"Free time ranges that fit {duration_minutes} minutes{notes}: ", slots)
+
+    except Exception as e:
+        return f"An error occurred while checking availability: {e}"
+
+
+# --- Event Name Lookup ---
+# Names are matched against the fuzzy name index in the user's event cache.
+# When it has no match, the next NAME_LOOKUP_HORIZON_DAYS are listed once (and
+# then kept fresh by incremental syncs) so the index covers the near future;
+# only names that still don't match go to the server's full-text search.
+NAME_LOOKUP_HORIZON_DAYS = 30
+NAME_MATCH_LIMIT = 5  # candidates kept per name
+NAME_AMBIGUITY_MARGIN = 0.1  # differently titled candidates this close to the best make a name ambiguous
+
+
+def _match_upcoming_events(service, names):
+    """Returns {name: [(score, event)], best first} of upcoming events for each name."""
+    cache = _get_event_cache(service)
+    now = dt.datetime.now(cache.tz)
+    names = list(dict.fromkeys(names))
+    matches = {name: cache.find_by_name(name, after=now, limit=NAME_MATCH_LIMIT) for name in names}
+    missing = [name for name in names if not matches[name]]
+    if missing:
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        _list_events_cached(service, today, today + dt.timedelta(days=NAME_LOOKUP_HORIZON_DAYS))
+        for name in missing:
+            matches[name] = cache.find_by_name(name, after=now, limit=NAME_MATCH_LIMIT)
+        missing = [name for name in missing if not matches[name]]
+    if missing:
+        searches = [
+            EventListing(service, limit=NAME_MATCH_LIMIT, q=name, timeMin=now.isoformat(), orderBy='startTime')
+            for name in missing
+        ]
+        if len(searches) == 1:
+            found = [list(searches[0])]
+        else:
+            # Only the first page of each is needed, so they can share one batch
+            found = []
+            for response, error in _execute_batch(service, [search.page_request() for search in searches]):
+                if error is not None:
+                    raise error
+                found.append(response.get('items', [])[:NAME_MATCH_LIMIT])
+        for name, items in zip(missing, found):
+            for item in items:
+                cache.upsert(item)
+            # The server also matches descriptions and locations, which the index doesn't score
+            matches[name] = cache.find_by_name(name, after=now, limit=NAME_MATCH_LIMIT) or [(0.0, item) for item in items]
+    return matches
+
+
+def _pick_event(matches, name, tz, confident=False):
+    """
+    Returns (event, None) for the clear best match, or (None, error) if there's
+    none or it's ambiguous. With confident=True (before changing or deleting
+    the event) a weak best match is an error too, listing the candidates.
+    """
+    if not matches:
+        return None, f"Could not find an upcoming event named '{name}'."
+    best_score, best = matches[0]
+    title = (best.get('summary') or '').lower()
+    rivals = [
+        event for score, event in matches[1:]
+        if best_score - score <= NAME_AMBIGUITY_MARGIN and (event.get('summary') or '').lower() != title
+    ]
+    if rivals:
+        options = "; ".join(f"{format_event(event, tz)} (event_id {event['id']})" for event in [best] + rivals)
+        return None, f"'{name}' could mean several events: {options}. Ask the user which one and pass its event_id."
+    if confident and not is_confident_match(name, best.get('summary'), best_score):
+        options = "; ".join(f"{format_event(event, tz)} (event_id {event['id']})" for _, event in matches)
+        return None, (f"No upcoming event is clearly named '{name}'. Closest: {options}. "
+                      "Ask the user whether they meant one of these and pass its event_id.")
+    return best, None
+
+
+def _resolve_event(service, event_name, event_id=None):
+    """
+    Finds the event a write tool should act on. Returns (event_id, title, None),
+    looking the name up unless an id was given, or (None, None, error).
+    """
+    cache = _get_event_cache(service)
+    if event_id:
+        cached = cache.get(event_id)
+        return event_id, (cached.get('summary') if cached else None) or event_name, None
+    event, error = _pick_event(_match_upcoming_events(service, [event_name])[event_name], event_name, cache.tz,
+                               confident=True)
+    if event is None:
+        return None, None, error
+    return event['id'], event.get('summary') or event_name, None
 
 @tool
-def update_event(event_name: str, new_summary: str = None, new_start_time: str = None, new_end_time: str = None, new_location: str = None):
+def update_event(event_name: str, new_summary: str = None, new_start_time: str = None, new_end_time: str = None, new_location: str = None, event_id: str = None):
     """
     Updates an existing event in the calendar. You must provide the original name and at least one new detail to change.
 
@@ -282,56 +603,284 @@ def update_event(event_name: str, new_summary: str = None, new_start_time: str =
         new_start_time (str, optional): The new start time for the event (e.g., '2025-09-10T14:00:00').
         new_end_time (str, optional): The new end time for the event (e.g., '2025-09-10T15:00:00').
         new_location (str, optional): The new location for the event.
+        event_id (str, optional): The event's id from find_event_by_name, if known; skips the name lookup.
 
     Returns:
         str: A confirmation message with the link to the updated event or an error message.
     """
     service = get_calendar_service()
     try:
-        event_id = _find_event_id(service, event_name)
+        event_id, title, error = _resolve_event(service, event_name, event_id)
         if not event_id:
-            return f"Error: Could not find an upcoming event named '{event_name}'."
-
-        event = service.events().get(calendarId='primary', eventId=event_id).execute()
-
-        # Update fields if new values are provided
-        if new_summary:
-            event['summary'] = new_summary
-        if new_location:
-            event['location'] = new_location
-        if new_start_time:
-            event['start']['dateTime'] = parse(new_start_time).isoformat()
-        if new_end_time:
-            event['end']['dateTime'] = parse(new_end_time).isoformat()
-            
-        updated_event = service.events().update(calendarId='primary', eventId=event_id, body=event).execute()
-        return f"Event '{event_name}' updated successfully: {updated_event.get('htmlLink')}"
+            return f"Error: {error}"
+
+        # patch only sends the changed fields, so there's no need to fetch the event first
+        timezone_str, user_timezone = get_calendar_timezone(service)
+        changes = _event_changes(timezone_str, user_timezone, new_summary, new_start_time, new_end_time, new_location)
+        updated_event = _execute_request(service.events().patch(calendarId='primary', eventId=event_id, body=changes))
+        _get_event_cache(service).upsert(updated_event)
+        return f"Event '{title}' updated successfully: {updated_event.get('htmlLink')}"
     except Exception as e:
         return f"An error occurred while updating the event: {e}"
 
 @tool
-def delete_event(event_name: str):
+def delete_event(event_name: str, event_id: str = None):
     """
     Deletes an event from the calendar by its name.
 
     Args:
         event_name (str): The name/summary of the event to delete.
+        event_id (str, optional): The event's id from find_event_by_name, if known; skips the name lookup.
 
     Returns:
         str: A confirmation that the event was deleted or an error message.
     """
     service = get_calendar_service()
     try:
-        event_id = _find_event_id(service, event_name)
+        event_id, title, error = _resolve_event(service, event_name, event_id)
         if not event_id:
-            return f"Error: Could not find an upcoming event named '{event_name}'."
+            return f"Error: {error}"
 
-        service.events().delete(calendarId='primary', eventId=event_id).execute()
-        return f"Event '{event_name}' was successfully deleted."
+        _execute_request(service.events().delete(calendarId='primary', eventId=event_id))
+        _get_event_cache(service).remove(event_id)
+        return f"Event '{title}' was successfully deleted."
     except Exception as e:
         return f"An error occurred while deleting the event: {e}"
 
 
+# --- Batch Mutations ---
+# Several creates, updates or deletes go to Google's batch endpoint together:
+# one HTTP round trip (per 50 requests) and one tool call for the whole set.
+# Every item succeeds or fails on its own and gets its own line in the result.
+BATCH_MAX_REQUESTS = 50  # the Calendar API's limit per batch
+
+
+def _parse_local_time(value, user_timezone):
+    """Parses a time string; times without an offset are taken as the calendar's time zone."""
+    parsed = parse(value)
+    return user_timezone.localize(parsed) if parsed.tzinfo is None else parsed
+
+
+def _new_event_body(timezone_str, user_timezone, start_time, end_time, summary=None, location=None,
+                    description=None, recurrence=None, attendees=None):
+    """The events().insert body for a new event, with times localized to the calendar's time zone."""
+    return {
+        'summary': summary,
+        'location': location,
+        'description': description,
+        'colorId': random.randint(1, 11),
+        'start': {
+            'dateTime': _parse_local_time(start_time, user_timezone).isoformat(),
+            'timeZone': timezone_str,
+        },
+        'end': {
+            'dateTime': _parse_local_time(end_time, user_timezone).isoformat(),
+            'timeZone': timezone_str,
+        },
+        'recurrence': recurrence,
+        # Attendees may be given as emails or as {"email": ...} dicts
+        'attendees': [a if isinstance(a, dict) else {'email': a} for a in attendees or []],
+    }
+
+
+def _event_changes(timezone_str, user_timezone, new_summary=None, new_start_time=None, new_end_time=None,
+                   new_location=None):
+    """The events().patch body holding only the fields being changed."""
+    changes = {}
+    if new_summary:
+        changes['summary'] = new_summary
+    if new_location:
+        changes['location'] = new_location
+    if new_start_time:
+        changes['start'] = {'dateTime': _parse_local_time(new_start_time, user_timezone).isoformat(), 'timeZone': timezone_str}
+    if new_end_time:
+        changes['end'] = {'dateTime': _parse_local_time(new_end_time, user_timezone).isoformat(), 'timeZone': timezone_str}
+    if not changes:
+        raise ValueError("nothing to change")
+    return changes
+
+
+def _error_text(error):
+    if isinstance(error, HttpError):
+        return f"{error.resp.status} {error.reason}"
+    return str(error)
+
+
+def _execute_batch(service, requests):
+    """
+    Executes requests through the batch endpoint, BATCH_MAX_REQUESTS at a time.
+    Returns one (response, error) pair per request, in request order.
+    """
+    if not requests:
+        return []
+    methods = ",".join(sorted({request.methodId for request in requests}))
+    with span("google.batch", requests=len(requests), methods=methods) as batch_span:
+        results = scheduler.execute_batch(service, requests, _credentials_key(_current_credentials()),
+                                          BATCH_MAX_REQUESTS, span=batch_span)
+        batch_span.set(errors=sum(1 for _, error in results if error))
+    return results
+
+
+class NewEvent(TypedDict, total=False):
+    """An event to create. Times are in this YYYY-MM-DDTHH:MM:SS format."""
+    start_time: Required[str]
+    end_time: Required[str]
+    summary: str
+    location: str
+    description: str
+    recurrence: List[str]
+    attendees: List[str]
+
+
+class EventChange(TypedDict, total=False):
+    """A change to one upcoming event, found by name (or event_id). Give at least one new_* field."""
+    event_name: Required[str]
+    event_id: str
+    new_summary: str
+    new_start_time: str
+    new_end_time: str
+    new_location: str
+
+
+@tool
+def create_events(events: List[NewEvent]):
+    """
+    Creates several events in one go, e.g. a standup on each day of the week.
+    Use this instead of calling set_calender_event repeatedly.
+
+    Args:
+        events (list): The events to create, each with start_time, end_time and optionally
+            summary, location, description, recurrence (RRULE strings) and attendees (emails).
+
+    Returns:
+        str: One line per event saying whether it was created, or why not.
+    """
+    service = get_calendar_service()
+    try:
+        timezone_str, user_timezone = get_calendar_timezone(service)
+        lines = [None] * len(events)
+        requests, positions = [], []
+        for index, item in enumerate(events):
+            try:
+                body = _new_event_body(timezone_str, user_timezone, item['start_time'], item['end_time'],
+                                       item.get('summary'), item.get('location'), item.get('description'),
+                                       item.get('recurrence'), item.get('attendees'))
+            except (KeyError, ValueError) as e:
+                lines[index] = f"{index + 1}. not created ({item.get('summary') or 'untitled'}): invalid {e}"
+                continue
+            requests.append(service.events().insert(calendarId='primary', body=body))
+            positions.append(index)
+
+        cache = _get_event_cache(service)
+        created = 0
+        for index, (event, error) in zip(positions, _execute_batch(service, requests)):
+            if error is not None:
+                lines[index] = f"{index + 1}. not created ({events[index].get('summary') or 'untitled'}): {_error_text(error)}"
+            else:
+                cache.upsert(event)
+                created += 1
+                lines[index] = f"{index + 1}. created: {format_event(event, user_timezone)}"
+        return encode_batch("create_events", f"Created {created} of {len(events)} events:", lines)
+    except Exception as e:
+        return f"An error occurred while creating the events: {e}"
+
+
+@tool
+def update_events(changes: List[EventChange]):
+    """
+    Changes several upcoming events in one go, e.g. moving all of Friday's meetings
+    an hour later. Use this instead of calling update_event repeatedly.
+
+    Args:
+        changes (list): One entry per event: event_name (and event_id if known) plus any of
+            new_summary, new_start_time, new_end_time (YYYY-MM-DDTHH:MM:SS) and new_location.
+
+    Returns:
+        str: One line per event saying whether it was updated, or why not.
+    """
+    service = get_calendar_service()
+    try:
+        timezone_str, user_timezone = get_calendar_timezone(service)
+        found = _match_upcoming_events(service, [c['event_name'] for c in changes if not c.get('event_id')])
+        lines = [None] * len(changes)
+        requests, positions = [], []
+        for index, change in enumerate(changes):
+            event_id = change.get('event_id')
+            if not event_id:
+                event, error = _pick_event(found[change['event_name']], change['event_name'], user_timezone,
+                                           confident=True)
+                if event is None:
+                    lines[index] = f"{index + 1}. not updated: {error}"
+                    continue
+                event_id = event['id']
+            try:
+                body = _event_changes(timezone_str, user_timezone, change.get('new_summary'), change.get('new_start_time'),
+                                      change.get('new_end_time'), change.get('new_location'))
+            except ValueError as e:
+                lines[index] = f"{index + 1}. not updated ({change['event_name']}): invalid {e}"
+                continue
+            requests.append(service.events().patch(calendarId='primary', eventId=event_id, body=body))
+            positions.append(index)
+
+        cache = _get_event_cache(service)
+        updated = 0
+        for index, (event, error) in zip(positions, _execute_batch(service, requests)):
+            if error is not None:
+                lines[index] = f"{index + 1}. not updated ({changes[index]['event_name']}): {_error_text(error)}"
+            else:
+                cache.upsert(event)
+                updated += 1
+                lines[index] = f"{index + 1}. updated: {format_event(event, user_timezone)}"
+        return encode_batch("update_events", f"Updated {updated} of {len(changes)} events:", lines)
+    except Exception as e:
+        return f"An error occurred while updating the events: {e}"
+
+
+@tool
+def delete_events(event_names: List[str]):
+    """
+    Deletes several upcoming events, found by name, in one go. Use this instead of
+    calling delete_event repeatedly.
+
+    Args:
+        event_names (list): The names/summaries of the events to delete.
+
+    Returns:
+        str: One line per event saying whether it was deleted, or why not.
+    """
+    service = get_calendar_service()
+    try:
+        user_timezone = _get_event_cache(service).tz
+        found = _match_upcoming_events(service, event_names)
+        lines = [None] * len(event_names)
+        requests, positions, targets, first_index = [], [], {}, {}
+        for index, name in enumerate(event_names):
+            event, error = _pick_event(found[name], name, user_timezone, confident=True)
+            if event is None:
+                lines[index] = f"{index + 1}. not deleted: {error}"
+                continue
+            # Two names for the same event: delete it once
+            if event['id'] in first_index:
+                lines[index] = f"{index + 1}. same event as item {first_index[event['id']] + 1}"
+                continue
+            first_index[event['id']] = index
+            requests.append(service.events().delete(calendarId='primary', eventId=event['id']))
+            positions.append(index)
+            targets[index] = event
+
+        cache = _get_event_cache(service)
+        deleted = 0
+        for index, (_, error) in zip(positions, _execute_batch(service, requests)):
+            if error is not None:
+                lines[index] = f"{index + 1}. not deleted ({event_names[index]}): {_error_text(error)}"
+            else:
+                cache.remove(targets[index]['id'])
+                deleted += 1
+                lines[index] = f"{index + 1}. deleted: {format_event(targets[index], user_timezone)}"
+        return encode_batch("delete_events", f"Deleted {deleted} of {len(event_names)} events:", lines)
+    except Exception as e:
+        return f"An error occurred while deleting the events: {e}"
+
 
 if __name__ == "__main__":
     print("Testing the calendar tools...")
@@ -0,0 +1,101 @@
+"""
+Process-level cache of users' Google OAuth credentials.
+
+Streamlit reruns the whole script on every interaction, and each rerun used to
+read the token document from Firestore and re-parse it. Credentials are kept
+here per user_id for a TTL instead. Concurrent reruns for the same user share
+a single load (single flight), and credentials are written back only when the
+access token has actually been refreshed. Expired entries are dropped as new
+ones come in, and at most CREDENTIAL_CACHE_MAX_USERS users are kept.
+"""
+
+import threading
+import time
+
+CREDENTIAL_CACHE_TTL_SECONDS = 10 * 60
+CREDENTIAL_CACHE_MAX_USERS = 1024
+
+
+class CredentialCache:
+    """Caches Credentials objects by user_id."""
+
+    def __init__(self, ttl=CREDENTIAL_CACHE_TTL_SECONDS, max_users=CREDENTIAL_CACHE_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = {}  # user_id -> [credentials, last persisted access token, loaded_at], oldest first
+        self._lock = threading.Lock()
+        self._loads = {}  # user_id -> [lock held while loading, callers using it]; gone once nobody is
+
+    def _fresh_entry(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is not None and time.monotonic() - entry[2] <= self.ttl:
+            return entry
+        return None
+
+    def get(self, user_id, loader):
+        """
+        Returns the cached credentials for user_id, calling loader(user_id) on a
+        miss. Only one caller per user runs the loader; the others wait for it.
+        """
+        with self._lock:
+            entry = self._fresh_entry(user_id)
+            if entry is not None:
+                return entry[0]
+            load = self._loads.setdefault(user_id, [threading.Lock(), 0])
+            load[1] += 1
+
+        try:
+            with load[0]:
+                with self._lock:
+                    entry = self._fresh_entry(user_id)
+                    if entry is not None:
+                        return entry[0]
+                creds = loader(user_id)
+                # Don't cache a miss: the user is probably about to log in
+                if creds is not None:
+                    self.put(user_id, creds)
+                return creds
+        finally:
+            with self._lock:
+                load[1] -= 1
+                if load[1] == 0:
+                    self._loads.pop(user_id, None)
+
+    def put(self, user_id, creds):
+        """Stores credentials that were just loaded or persisted."""
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(user_id, None)
+            # Entries are in insertion order, so the expired ones are at the front
+            while self._entries:
+                oldest = next(iter(self._entries))
+                if now - self._entries[oldest][2] <= self.ttl and len(self._entries) < self.max_users:
+                    break
+                del self._entries[oldest]
+            self._entries[user_id] = [creds, creds.token, now]
+
+    def write_back_if_refreshed(self, user_id, creds, saver):
+        """
+        Calls saver(user_id, creds) only if the access token changed since it was
+        last loaded or saved, i.e. google-auth refreshed it during API calls.
+        """
+        if creds is None:
+            return False
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] == creds.token:
+                return False
+        saver(user_id, creds)
+        self.put(user_id, creds)
+        return True
+
+    def invalidate(self, user_id=None):
+        """Forgets one user's credentials, or everyone's."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+credential_cache = CredentialCache()
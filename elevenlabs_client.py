@@ -0,0 +1,115 @@
+"""
+Shared ElevenLabs clients.
+
+Creating an ElevenLabs client per call throws away its HTTP connection pool, so
+every STT/TTS request paid for a fresh TCP + TLS handshake. Clients are kept
+here in a small LRU pool keyed by API key (users can bring their own key), each
+with a persistent httpx connection pool that stays alive between voice turns.
+"""
+
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+
+import httpx
+
+# Pool and HTTP settings (overridable through the environment)
+ELEVENLABS_CLIENT_POOL_SIZE = int(os.getenv("ELEVENLABS_CLIENT_POOL_SIZE", "16"))  # distinct API keys kept
+ELEVENLABS_MAX_CONNECTIONS = int(os.getenv("ELEVENLABS_MAX_CONNECTIONS", "10"))  # per client
+ELEVENLABS_MAX_KEEPALIVE = int(os.getenv("ELEVENLABS_MAX_KEEPALIVE", "5"))  # idle connections kept open
+ELEVENLABS_KEEPALIVE_EXPIRY = float(os.getenv("ELEVENLABS_KEEPALIVE_EXPIRY", "120"))  # seconds
+ELEVENLABS_CONNECT_TIMEOUT = float(os.getenv("ELEVENLABS_CONNECT_TIMEOUT", "5"))
+ELEVENLABS_READ_TIMEOUT = float(os.getenv("ELEVENLABS_READ_TIMEOUT", "60"))
+# Lets benchmarks and local stubs stand in for the real API
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL")
+
+_clients = OrderedDict()  # (api_key, base_url) -> (ElevenLabs, httpx.Client)
+_clients_lock = threading.Lock()
+_async_clients = OrderedDict()  # (api_key, base_url, event loop) -> (AsyncElevenLabs, httpx.AsyncClient)
+
+
+def _http_client(client_class=httpx.Client):
+    """Creates the persistent, pooled httpx client shared by one ElevenLabs client."""
+    return client_class(
+        limits=httpx.Limits(
+            max_connections=ELEVENLABS_MAX_CONNECTIONS,
+            max_keepalive_connections=ELEVENLABS_MAX_KEEPALIVE,
+            keepalive_expiry=ELEVENLABS_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(ELEVENLABS_READ_TIMEOUT, connect=ELEVENLABS_CONNECT_TIMEOUT),
+        follow_redirects=True,
+    )
+
+
+def get_elevenlabs_client(api_key=None, base_url=None):
+    """
+    Returns a shared ElevenLabs client for the given API key (defaults to the
+    ELEVENLABS_API_KEY environment variable), creating it on first use.
+    """
+    api_key = api_key or os.getenv("ELEVENLABS_API_KEY")
+    base_url = base_url or ELEVENLABS_BASE_URL
+    key = (api_key, base_url)
+
+    with _clients_lock:
+        entry = _clients.get(key)
+        if entry is not None:
+            _clients.move_to_end(key)
+            return entry[0]
+
+        # The SDK is heavy to import; load it with the first client
+        from elevenlabs.client import ElevenLabs
+
+        http_client = _http_client()
+        client = ElevenLabs(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=ELEVENLABS_READ_TIMEOUT,
+            httpx_client=http_client,
+        )
+        _clients[key] = (client, http_client)
+        while len(_clients) > ELEVENLABS_CLIENT_POOL_SIZE:
+            _, (_, evicted_http) = _clients.popitem(last=False)
+            evicted_http.close()
+        return client
+
+
+def get_async_elevenlabs_client(api_key=None, base_url=None):
+    """
+    Async counterpart of get_elevenlabs_client() for the turn service. An
+    httpx.AsyncClient belongs to the event loop it was first used on, so
+    clients are pooled per running loop as well as per API key.
+    """
+    api_key = api_key or os.getenv("ELEVENLABS_API_KEY")
+    base_url = base_url or ELEVENLABS_BASE_URL
+    key = (api_key, base_url, asyncio.get_running_loop())
+
+    with _clients_lock:
+        entry = _async_clients.get(key)
+        if entry is not None:
+            _async_clients.move_to_end(key)
+            return entry[0]
+
+        from elevenlabs.client import AsyncElevenLabs
+
+        http_client = _http_client(httpx.AsyncClient)
+        client = AsyncElevenLabs(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=ELEVENLABS_READ_TIMEOUT,
+            httpx_client=http_client,
+        )
+        _async_clients[key] = (client, http_client)
+        while len(_async_clients) > ELEVENLABS_CLIENT_POOL_SIZE:
+            (_, _, loop), (_, evicted_http) = _async_clients.popitem(last=False)
+            if not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(evicted_http.aclose(), loop)
+        return client
+
+
+def close_elevenlabs_clients():
+    """Closes every pooled client and its connections."""
+    with _clients_lock:
+        for _, http_client in _clients.values():
+            http_client.close()
+        _clients.clear()
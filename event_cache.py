@@ -0,0 +1,330 @@
+"""
+Short-TTL, per-user cache of Google Calendar events.
+
+Events are stored together with the time windows they were fetched for, so a
+range query that falls inside already-fetched windows (even ones fetched for
+different, overlapping ranges) is answered locally. Name lookups are served
+from the same events through a fuzzy trigram index. Writes patch the cache, and
+a Calendar syncToken (when the API hands one out) lets stale windows be
+refreshed with an incremental sync instead of a full re-fetch.
+"""
+
+import re
+import threading
+import time
+import datetime as dt
+from collections import defaultdict
+from dateutil.parser import isoparse
+
+EVENT_CACHE_TTL_SECONDS = 60
+EVENT_CACHE_MAX_USERS = 256
+
+# --- Name matching ---
+# Words that carry no identity in spoken references ("the dentist thing",
+# "my sync with Sarah"); dropped from queries and titles unless nothing else is left
+NAME_STOPWORDS = frozenset(
+    "a an the my our your this that these those thing event meeting call with for on at to of and in".split()
+)
+NAME_MATCH_MIN_SCORE = 0.5  # below this a candidate isn't considered a match
+NAME_WRITE_MIN_SCORE = 0.85  # a match that changes or deletes the event must be at least this close
+NAME_TIME_WEIGHT = 0.15  # how much a match loses for being far in the future
+NAME_TIME_HORIZON_DAYS = 30  # beyond this, distance no longer lowers the score
+
+
+def name_tokens(text):
+    """Lowercased words of a name, without stopwords."""
+    words = re.findall(r"\w+", (text or "").lower())
+    return [w for w in words if w not in NAME_STOPWORDS] or words
+
+
+def is_confident_match(query, title, score):
+    """
+    True if title is close enough to query to act on without asking: every word
+    of the query appears in the title, or the fuzzy score is high (small typos).
+    """
+    title_words = set(name_tokens(title))
+    return score >= NAME_WRITE_MIN_SCORE or all(word in title_words for word in name_tokens(query))
+
+
+def name_trigrams(tokens):
+    """Character trigrams of each token, padded so word starts and ends count."""
+    grams = set()
+    for token in tokens:
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NameIndex:
+    """
+    Trigram index over event titles and attendee names. A query is scored
+    against each candidate by how much of it the event's name contains (so
+    "dentist" matches "Dentist appointment" fully) blended with the overlap
+    of the two titles (so the closer title wins), which tolerates typos and
+    speech-to-text spelling.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(set)  # trigram -> event ids
+        self._docs = {}  # event id -> (title trigrams, title + attendee trigrams)
+
+    def add(self, event_id, title, attendees=()):
+        self.remove(event_id)
+        title_grams = name_trigrams(name_tokens(title))
+        # "sync with Sarah" should find "Project sync" when sarah@... attends
+        people = [part for email in attendees for part in re.split(r"[._+-]", email.split("@")[0]) if part]
+        all_grams = title_grams | name_trigrams(name_tokens(" ".join(people)))
+        self._docs[event_id] = (title_grams, all_grams)
+        for gram in all_grams:
+            self._postings[gram].add(event_id)
+
+    def remove(self, event_id):
+        doc = self._docs.pop(event_id, None)
+        if doc is None:
+            return
+        for gram in doc[1]:
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def clear(self):
+        self._postings.clear()
+        self._docs.clear()
+
+    def search(self, query):
+        """Returns {event id: similarity in [0, 1]} for every event sharing a trigram with query."""
+        query_grams = name_trigrams(name_tokens(query))
+        if not query_grams:
+            return {}
+        overlap = defaultdict(int)
+        for gram in query_grams:
+            for event_id in self._postings.get(gram, ()):
+                overlap[event_id] += 1
+        scores = {}
+        for event_id, shared in overlap.items():
+            title_grams, _ = self._docs[event_id]
+            containment = shared / len(query_grams)
+            dice = 2 * len(query_grams & title_grams) / (len(query_grams) + len(title_grams) or 1)
+            scores[event_id] = 0.7 * containment + 0.3 * dice
+        return scores
+
+
+def _to_datetime(value, tz):
+    """Parses an event start/end value (dateTime or all-day date) into an aware datetime."""
+    parsed = isoparse(value)
+    if parsed.tzinfo is None:
+        parsed = tz.localize(parsed)
+    return parsed
+
+
+def event_bounds(event, tz):
+    """Returns the (start, end) of an event as aware datetimes."""
+    start = event["start"].get("dateTime", event["start"].get("date"))
+    end = event["end"].get("dateTime", event["end"].get("date"))
+    return _to_datetime(start, tz), _to_datetime(end, tz)
+
+
+class EventCache:
+    """Events for one user, indexed by the time windows they were fetched for."""
+
+    def __init__(self, tz, ttl=EVENT_CACHE_TTL_SECONDS):
+        self.tz = tz
+        self.ttl = ttl
+        self.windows = []  # sorted, non-overlapping [start, end, fetched_at]
+        self.events = {}  # event id -> (event, start, end, cached_at)
+        self.sync_token = None
+        self.sync_token_at = float("-inf")  # when the state sync_token describes was fetched
+        self.names = NameIndex()
+        self.lock = threading.RLock()
+
+    def _is_fresh(self, fetched_at, now):
+        return now - fetched_at <= self.ttl
+
+    def covers(self, start, end, fresh=True):
+        """True if [start, end) lies inside fetched windows (fresh ones only by default)."""
+        now = time.monotonic()
+        with self.lock:
+            cursor = start
+            for w_start, w_end, fetched_at in self.windows:
+                if fresh and not self._is_fresh(fetched_at, now):
+                    continue
+                if w_start > cursor:
+                    break
+                if w_end > cursor:
+                    cursor = w_end
+                if cursor >= end:
+                    return True
+            return cursor >= end
+
+    def query(self, start, end):
+        """
+        Returns the cached events overlapping [start, end) sorted by start time,
+        or None if the range isn't fully covered by fresh windows.
+        """
+        with self.lock:
+            if not self.covers(start, end):
+                return None
+            hits = [
+                (e_start, event)
+                for event, e_start, e_end, _ in self.events.values()
+                if e_start < end and e_end > start
+            ]
+        hits.sort(key=lambda item: item[0])
+        return [event for _, event in hits]
+
+    def store(self, start, end, events, sync_token=None):
+        """Records the complete result of fetching [start, end)."""
+        now = time.monotonic()
+        with self.lock:
+            # Anything we had in this window but the API didn't return is gone
+            for event_id, (_, e_start, e_end, _) in list(self.events.items()):
+                if e_start < end and e_end > start:
+                    self._drop(event_id)
+            for event in events:
+                self._put(event, now)
+            self._add_window(start, end, now)
+            # Keep the oldest token: a newer one would skip changes made since
+            # the earlier windows were fetched
+            if sync_token and not self.sync_token:
+                self.sync_token = sync_token
+                self.sync_token_at = now
+
+    def _put(self, event, now):
+        e_start, e_end = event_bounds(event, self.tz)
+        self.events[event["id"]] = (event, e_start, e_end, now)
+        attendees = [a.get("email", "") for a in event.get("attendees") or [] if not a.get("self")]
+        self.names.add(event["id"], event.get("summary"), attendees)
+
+    def _drop(self, event_id):
+        self.events.pop(event_id, None)
+        self.names.remove(event_id)
+
+    def _add_window(self, start, end, fetched_at):
+        """Inserts a window and merges it with overlapping ones."""
+        merged = []
+        for w_start, w_end, w_fetched in sorted(self.windows + [[start, end, fetched_at]]):
+            if merged and w_start <= merged[-1][1]:
+                last = merged[-1]
+                last[1] = max(last[1], w_end)
+                # A merged window is only as fresh as its oldest part
+                last[2] = min(last[2], w_fetched)
+            else:
+                merged.append([w_start, w_end, w_fetched])
+        self.windows = merged
+
+    def find_by_name(self, query, after=None, limit=5, min_score=NAME_MATCH_MIN_SCORE):
+        """
+        Returns up to `limit` fresh cached events whose name fuzzily matches query,
+        as (score, event) pairs, best first. Events that ended before `after` are
+        skipped; among similar names the sooner event ranks higher.
+        """
+        now = time.monotonic()
+        reference = after or dt.datetime.now(self.tz)
+        with self.lock:
+            hits = []
+            for event_id, similarity in self.names.search(query).items():
+                event, e_start, e_end, cached_at = self.events[event_id]
+                if not self._is_fresh(cached_at, now):
+                    continue
+                if after is not None and e_end <= after:
+                    continue
+                days_ahead = max((e_start - reference).total_seconds() / 86400, 0)
+                score = similarity * (1 - NAME_TIME_WEIGHT * min(days_ahead / NAME_TIME_HORIZON_DAYS, 1))
+                if score >= min_score:
+                    hits.append((score, e_start, event))
+        hits.sort(key=lambda item: (-item[0], item[1]))
+        return [(round(score, 3), event) for score, _, event in hits[:limit]]
+
+    def get(self, event_id):
+        """The cached event with this id, or None."""
+        with self.lock:
+            entry = self.events.get(event_id)
+            return entry[0] if entry else None
+
+    def upsert(self, event):
+        """Adds or replaces a single event, e.g. after an insert or update."""
+        with self.lock:
+            if event.get("status") == "cancelled":
+                self._drop_series(event["id"])
+            elif event.get("recurrence"):
+                # A series master only describes its first occurrence; the
+                # windows it repeats into are fetched again as instances
+                self._drop_series(event["id"])
+                self._expire_windows(event_bounds(event, self.tz)[0])
+            else:
+                self._put(event, time.monotonic())
+
+    def remove(self, event_id):
+        """Drops an event (and its instances, if it's a series), e.g. after a delete."""
+        with self.lock:
+            self._drop_series(event_id)
+
+    def _drop_series(self, event_id):
+        self._drop(event_id)
+        for instance_id, (event, _, _, _) in list(self.events.items()):
+            if event.get("recurringEventId") == event_id:
+                self._drop(instance_id)
+
+    def _expire_windows(self, start):
+        """Marks every window reaching past start stale, so it's re-fetched rather than synced."""
+        for window in self.windows:
+            if window[1] > start:
+                window[2] = float("-inf")
+
+    def apply_changes(self, changed_events, sync_token):
+        """
+        Applies the result of an incremental (syncToken) list. Windows and events
+        fetched since the old token are now in sync with the server and become
+        fresh again; anything older may have missed changes and stays stale.
+        """
+        now = time.monotonic()
+        with self.lock:
+            since = self.sync_token_at
+            for window in self.windows:
+                if window[2] >= since:
+                    window[2] = now
+            for event_id, (event, e_start, e_end, cached_at) in list(self.events.items()):
+                if cached_at >= since:
+                    self.events[event_id] = (event, e_start, e_end, now)
+            for event in changed_events:
+                if event.get("status") == "cancelled":
+                    self._drop(event["id"])
+                else:
+                    self._put(event, now)
+            self.sync_token = sync_token
+            self.sync_token_at = now
+
+    def invalidate(self):
+        """Forgets everything, including the sync token."""
+        with self.lock:
+            self.windows = []
+            self.events = {}
+            self.names.clear()
+            self.sync_token = None
+            self.sync_token_at = float("-inf")
+
+
+_caches = {}  # user key -> EventCache
+_caches_lock = threading.Lock()
+
+
+def get_event_cache(user_key, tz):
+    """Returns the event cache for a user, creating it on first use."""
+    with _caches_lock:
+        cache = _caches.get(user_key)
+        if cache is None or cache.tz.zone != tz.zone:
+            if len(_caches) >= EVENT_CACHE_MAX_USERS:
+                _caches.pop(next(iter(_caches)))
+            cache = _caches[user_key] = EventCache(tz)
+        return cache
+
+
+def drop_event_cache(user_key=None):
+    """Removes one user's cache, or all caches when user_key is None."""
+    with _caches_lock:
+        if user_key is None:
+            _caches.clear()
+        else:
+            _caches.pop(user_key, None)
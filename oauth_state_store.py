@@ -0,0 +1,187 @@
+"""
+Storage for pending OAuth `state` values.
+
+Each login attempt stores its state together with the user_id so the redirect
+back can restore the session. States expire after OAUTH_STATE_TTL_SECONDS;
+expired ones are removed by a periodic batched sweep (and, for Firestore, by a
+TTL policy on the `expires_at` field if one is configured). Verification takes
+the state out of the store in one atomic step so it can only be used once.
+
+Backends: Firestore for deployments, SQLite or in-memory for local testing.
+"""
+
+import abc
+import datetime as dt
+import sqlite3
+from contextlib import closing
+import threading
+import time
+
+OAUTH_STATE_TTL_SECONDS = 15 * 60
+OAUTH_STATE_SWEEP_INTERVAL_SECONDS = 10 * 60
+FIRESTORE_BATCH_LIMIT = 500  # maximum writes in one Firestore batch
+
+
+class OAuthStateStore(abc.ABC):
+    """Interface shared by all backends."""
+
+    def __init__(self, ttl=OAUTH_STATE_TTL_SECONDS, sweep_interval=OAUTH_STATE_SWEEP_INTERVAL_SECONDS):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._sweep_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def put(self, state, user_id):
+        """Saves a new state for user_id."""
+
+    @abc.abstractmethod
+    def pop(self, state):
+        """Atomically removes a state and returns its user_id, or None if unknown or expired."""
+
+    @abc.abstractmethod
+    def sweep(self):
+        """Deletes expired states and returns how many were removed."""
+
+    def maybe_sweep(self):
+        """Runs sweep() in the background if the sweep interval has passed."""
+        with self._sweep_lock:
+            if time.monotonic() - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = time.monotonic()
+        threading.Thread(target=self._sweep_safely, daemon=True).start()
+
+    def _sweep_safely(self):
+        try:
+            removed = self.sweep()
+            if removed:
+                print(f"--- Removed {removed} expired OAuth states ---")
+        except Exception as e:
+            print(f"OAuth state sweep failed: {e}")
+
+
+class InMemoryOAuthStateStore(OAuthStateStore):
+    """Keeps states in a dict; only suitable for a single local process."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._states = {}  # state -> (user_id, expires_at)
+        self._lock = threading.Lock()
+
+    def put(self, state, user_id):
+        with self._lock:
+            self._states[state] = (user_id, time.time() + self.ttl)
+        self.maybe_sweep()
+
+    def pop(self, state):
+        with self._lock:
+            entry = self._states.pop(state, None)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [state for state, (_, expires_at) in self._states.items() if expires_at < now]
+            for state in expired:
+                del self._states[state]
+        return len(expired)
+
+
+class SQLiteOAuthStateStore(OAuthStateStore):
+    """Keeps states in a local SQLite file, so they survive restarts during development."""
+
+    def __init__(self, path="oauth_states.sqlite3", **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS oauth_states ("
+            "state TEXT PRIMARY KEY, user_id TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._execute("CREATE INDEX IF NOT EXISTS oauth_states_expires_at ON oauth_states (expires_at)")
+
+    def _execute(self, sql, params=()):
+        """Runs one statement in its own transaction; returns (first row, rowcount)."""
+        with closing(sqlite3.connect(self.path, timeout=5)) as conn, conn:
+            cursor = conn.execute(sql, params)
+            return cursor.fetchone(), cursor.rowcount
+
+    def put(self, state, user_id):
+        self._execute(
+            "INSERT OR REPLACE INTO oauth_states (state, user_id, expires_at) VALUES (?, ?, ?)",
+            (state, user_id, time.time() + self.ttl),
+        )
+        self.maybe_sweep()
+
+    def pop(self, state):
+        # DELETE ... RETURNING reads and removes the row in a single statement
+        row, _ = self._execute(
+            "DELETE FROM oauth_states WHERE state = ? RETURNING user_id, expires_at", (state,)
+        )
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def sweep(self):
+        _, removed = self._execute("DELETE FROM oauth_states WHERE expires_at < ?", (time.time(),))
+        return removed
+
+
+class FirestoreOAuthStateStore(OAuthStateStore):
+    """
+    Keeps states in a Firestore collection. Documents carry an `expires_at`
+    timestamp; enabling a Firestore TTL policy on that field lets the server
+    delete them too, and sweep() covers deployments without one.
+    """
+
+    def __init__(self, db, collection="oauth_states", **kwargs):
+        super().__init__(**kwargs)
+        self.db = db
+        self.collection = db.collection(collection)
+
+    def put(self, state, user_id):
+        from google.cloud.firestore_v1.transforms import SERVER_TIMESTAMP
+
+        self.collection.document(state).set({
+            'timestamp': SERVER_TIMESTAMP,
+            'expires_at': dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=self.ttl),
+            'user_id': user_id,
+        })
+        self.maybe_sweep()
+
+    def pop(self, state):
+        from google.cloud import firestore
+
+        @firestore.transactional
+        def take(transaction, ref):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            transaction.delete(ref)
+            return snapshot.to_dict()
+
+        data = take(self.db.transaction(), self.collection.document(state))
+        if data is None:
+            return None
+        expires_at = data.get('expires_at')
+        if expires_at is not None and expires_at < dt.datetime.now(dt.timezone.utc):
+            return None
+        return data.get('user_id')
+
+    def sweep(self):
+        now = dt.datetime.now(dt.timezone.utc)
+        removed = 0
+        while True:
+            expired = list(
+                self.collection.where('expires_at', '<', now).limit(FIRESTORE_BATCH_LIMIT).stream()
+            )
+            if not expired:
+                return removed
+            batch = self.db.batch()
+            for snapshot in expired:
+                batch.delete(snapshot.reference)
+            batch.commit()
+            removed += len(expired)
+            if len(expired) < FIRESTORE_BATCH_LIMIT:
+                return removed
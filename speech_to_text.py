@@ -2,25 +2,40 @@
 import os
 from dotenv import load_dotenv
 from io import BytesIO
-from elevenlabs.client import ElevenLabs
+from elevenlabs_client import get_elevenlabs_client, get_async_elevenlabs_client
+from tracing import span
 
 load_dotenv()
 
 def transcribe_audio(audio_bytes):
     # with open(audio_path, "rb") as f:
     #     audio_data = BytesIO(f.read())
-    elevenlabs = ElevenLabs(
-        api_key=os.getenv("ELEVENLABS_API_KEY"),
-    )
-    audio_data = BytesIO(audio_bytes)
-    transcription = elevenlabs.speech_to_text.convert(
-        file=audio_data,
-        model_id="scribe_v1", # Model to use, for now only "scribe_v1" is supported
-        tag_audio_events=True, # Tag audio events like laughter, applause, etc.
-        language_code="eng", # Language of the audio file. If set to None, the model will detect the language automatically.
-        diarize=True, # Whether to annotate who is speaking
-    )
+    with span("stt", audio_bytes=len(audio_bytes)) as stt_span:
+        elevenlabs = get_elevenlabs_client(os.getenv("ELEVENLABS_API_KEY"))
+        audio_data = BytesIO(audio_bytes)
+        transcription = elevenlabs.speech_to_text.convert(
+            file=audio_data,
+            model_id="scribe_v1", # Model to use, for now only "scribe_v1" is supported
+            tag_audio_events=True, # Tag audio events like laughter, applause, etc.
+            language_code="eng", # Language of the audio file. If set to None, the model will detect the language automatically.
+            diarize=True, # Whether to annotate who is speaking
+        )
+        stt_span.set(chars=len(transcription.text or ""))
+    return transcription.text
+
 
+async def atranscribe_audio(audio_bytes):
+    """Async variant of transcribe_audio() for the turn service."""
+    with span("stt", audio_bytes=len(audio_bytes)) as stt_span:
+        elevenlabs = get_async_elevenlabs_client(os.getenv("ELEVENLABS_API_KEY"))
+        transcription = await elevenlabs.speech_to_text.convert(
+            file=BytesIO(audio_bytes),
+            model_id="scribe_v1",
+            tag_audio_events=True,
+            language_code="eng",
+            diarize=True,
+        )
+        stt_span.set(chars=len(transcription.text or ""))
     return transcription.text
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from calendar_scheduler import CalendarScheduler  # noqa: E402
+from fakes import FakeBatch, FakeCalendarService, _http_error  # noqa: E402
+
+
+class FlakyBatch(FakeBatch):
+    """Fails the whole batch with a 503 the first time any batch is sent."""
+
+    sent = []
+    failures = 1
+
+    def execute(self):
+        FlakyBatch.sent.extend(request_id for _, _, request_id in self._requests)
+        if FlakyBatch.failures:
+            FlakyBatch.failures -= 1
+            raise _http_error(503, "backendError")
+        super().execute()
+
+
+def test_batch_failure_does_not_resend_inserts():
+    FlakyBatch.sent, FlakyBatch.failures = [], 1
+    service = FakeCalendarService()
+    service.new_batch_http_request = lambda callback=None: FlakyBatch(service, callback)
+    scheduler = CalendarScheduler(backoff_base=0, backoff_max=0)
+    inserts = [
+        service.events().insert(calendarId="primary", body={
+            "summary": f"Standup {i}",
+            "start": {"dateTime": "2030-06-03T09:00:00-04:00"},
+            "end": {"dateTime": "2030-06-03T09:15:00-04:00"},
+        })
+        for i in range(2)
+    ]
+
+    results = scheduler.execute_batch(service, inserts, "user", chunk_size=50)
+
+    assert sorted(FlakyBatch.sent) == ["0", "1"]
+    assert all(error is not None and error.resp.status == 503 for _, error in results)
+    assert not service._events
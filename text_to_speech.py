@@ -1,29 +1,74 @@
 from typing import IO
 from io import BytesIO
-from elevenlabs import VoiceSettings
-from elevenlabs.client import ElevenLabs
+from elevenlabs_client import get_elevenlabs_client, get_async_elevenlabs_client
+from tts_cache import TTSCache, normalize_text, tts_cache_key
+from tracing import span
 from dotenv import load_dotenv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
 import os
+import re
 load_dotenv()
 
-def generate_tts(text):
-    elevenlabs = ElevenLabs(
-        api_key=os.getenv("ELEVENLABS_API_KEY"),
-    )
+# A sentence ends with ., ! or ? followed by whitespace
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+# Voice configuration; every field is part of the TTS cache key
+TTS_VOICE_ID = "pNInz6obpgDQGcFmaJgB" # Adam pre-made voice
+TTS_MODEL_ID = "eleven_multilingual_v2"
+TTS_OUTPUT_FORMAT = "mp3_22050_32"
+# Optional voice settings that allow you to customize the output
+TTS_VOICE_SETTINGS = {
+    "stability": 0.0,
+    "similarity_boost": 1.0,
+    "style": 0.0,
+    "use_speaker_boost": True,
+    "speed": 1.0,
+}
+
+# Output presets offered in the UI, smallest first. Pick the lowest one that
+# sounds acceptable for the connection; speech needs far less than music.
+AUDIO_PRESETS = {
+    "Low bandwidth (MP3, 32 kbps)": "mp3_22050_32",
+    "Low bandwidth (Opus, 32 kbps)": "opus_48000_32",
+    "Standard (MP3, 64 kbps)": "mp3_44100_64",
+    "High (MP3, 128 kbps)": "mp3_44100_128",
+}
+
+_MIME_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "ulaw": "audio/basic",
+    "pcm": "audio/L16",
+}
+
+
+def audio_mime_type(output_format):
+    """Returns the MIME type of an ElevenLabs output_format such as 'mp3_22050_32'."""
+    return _MIME_TYPES.get(output_format.split("_", 1)[0], "application/octet-stream")
+
+# Phrases to synthesize at startup so their first use is instant, separated by
+# "|", e.g. replies the deployment's prompt makes the agent say word for word.
+# They're only cache hits if spoken exactly so, in the same output format.
+TTS_PREWARM_PHRASES = [p.strip() for p in os.getenv("TTS_PREWARM_PHRASES", "").split("|") if p.strip()]
+
+tts_cache = TTSCache()
+
+
+def _synthesize(text, output_format=TTS_OUTPUT_FORMAT):
+    """Calls ElevenLabs and returns the complete audio for text."""
+    from elevenlabs import VoiceSettings
+
+    elevenlabs = get_elevenlabs_client(os.getenv("ELEVENLABS_API_KEY"))
     # Perform the text-to-speech conversion
     response = elevenlabs.text_to_speech.stream(
-        voice_id="pNInz6obpgDQGcFmaJgB", # Adam pre-made voice
-        output_format="mp3_22050_32",
+        voice_id=TTS_VOICE_ID,
+        output_format=output_format,
         text=text,
-        model_id="eleven_multilingual_v2",
-        # Optional voice settings that allow you to customize the output
-        voice_settings=VoiceSettings(
-            stability=0.0,
-            similarity_boost=1.0,
-            style=0.0,
-            use_speaker_boost=True,
-            speed=1.0,
-        ),
+        model_id=TTS_MODEL_ID,
+        voice_settings=VoiceSettings(**TTS_VOICE_SETTINGS),
     )
 
     # Create a BytesIO object to hold the audio data in memory
@@ -40,6 +85,152 @@ def generate_tts(text):
 
     return wav_bytes
 
+
+def generate_tts(text, output_format=TTS_OUTPUT_FORMAT):
+    """Returns speech for text, from the TTS cache when this exact request was made before."""
+    with span("tts", chars=len(text), output_format=output_format) as tts_span:
+        key = tts_cache_key(text, TTS_VOICE_ID, TTS_MODEL_ID, output_format, TTS_VOICE_SETTINGS)
+        audio = tts_cache.get(key)
+        tts_span.set(cache_hit=audio is not None)
+        if audio is None:
+            audio = _synthesize(normalize_text(text), output_format)
+            tts_cache.put(key, audio)
+        tts_span.set(audio_bytes=len(audio))
+        return audio
+
+
+async def _asynthesize(text, output_format=TTS_OUTPUT_FORMAT):
+    """Async variant of _synthesize() on the pooled async client."""
+    from elevenlabs import VoiceSettings
+
+    elevenlabs = get_async_elevenlabs_client(os.getenv("ELEVENLABS_API_KEY"))
+    audio_stream = BytesIO()
+    async for chunk in elevenlabs.text_to_speech.stream(
+        voice_id=TTS_VOICE_ID,
+        output_format=output_format,
+        text=text,
+        model_id=TTS_MODEL_ID,
+        voice_settings=VoiceSettings(**TTS_VOICE_SETTINGS),
+    ):
+        if chunk:
+            audio_stream.write(chunk)
+    return audio_stream.getvalue()
+
+
+async def agenerate_tts(text, output_format=TTS_OUTPUT_FORMAT):
+    """Async variant of generate_tts(); cache disk I/O runs in a worker thread."""
+    with span("tts", chars=len(text), output_format=output_format) as tts_span:
+        key = tts_cache_key(text, TTS_VOICE_ID, TTS_MODEL_ID, output_format, TTS_VOICE_SETTINGS)
+        audio = await asyncio.to_thread(tts_cache.get, key)
+        tts_span.set(cache_hit=audio is not None)
+        if audio is None:
+            audio = await _asynthesize(normalize_text(text), output_format)
+            await asyncio.to_thread(tts_cache.put, key, audio)
+        tts_span.set(audio_bytes=len(audio))
+        return audio
+
+
+def clean_text(text):
+    """Keeps only characters that read well when spoken."""
+    return re.sub(r"[^a-zA-Z0-9 ,.!?'-]", '', text.replace("\n", " "))
+
+
+def prewarm_tts_cache(phrases=TTS_PREWARM_PHRASES, output_format=TTS_OUTPUT_FORMAT):
+    """Synthesizes any of the given phrases that aren't cached yet in output_format."""
+    for phrase in phrases:
+        try:
+            generate_tts(phrase, output_format)
+        except Exception as e:
+            print(f"Could not pre-warm TTS cache for '{phrase}': {e}")
+
+
+class SentenceChunker:
+    """
+    Accumulates streamed text and hands back complete sentences as soon as
+    they end. Very short sentences are merged with the next one so TTS
+    isn't called for fragments like "Sure.".
+    """
+
+    def __init__(self, min_chars=20):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        """Adds text and returns the list of sentences completed by it."""
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(self.buffer):
+            candidate = self.buffer[start:match.start()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Returns whatever text is left once the stream has ended."""
+        remaining = self.buffer.strip()
+        self.buffer = ""
+        return remaining
+
+
+def stream_tts(text_stream, output_format=TTS_OUTPUT_FORMAT, max_workers=2):
+    """
+    Turns a stream of text chunks into a stream of (sentence, audio_bytes).
+    Each sentence is sent to TTS as soon as it is complete, while the text
+    stream keeps being consumed; audio is yielded in sentence order.
+    """
+    chunker = SentenceChunker()
+    pending = deque()  # (sentence, future) in spoken order
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts") as pool:
+        for text in text_stream:
+            for sentence in chunker.feed(text):
+                pending.append((sentence, pool.submit(contextvars.copy_context().run, generate_tts, sentence, output_format)))
+            # Hand back audio that is already done without blocking the text stream
+            while pending and pending[0][1].done():
+                sentence, future = pending.popleft()
+                yield sentence, future.result()
+
+        remaining = chunker.flush()
+        if remaining:
+            pending.append((remaining, pool.submit(contextvars.copy_context().run, generate_tts, remaining, output_format)))
+        while pending:
+            sentence, future = pending.popleft()
+            yield sentence, future.result()
+
+async def astream_tts(text_stream, output_format=TTS_OUTPUT_FORMAT, max_concurrency=2):
+    """
+    Async variant of stream_tts() over an async iterator of text chunks.
+    Sentences are synthesized concurrently (at most max_concurrency at a
+    time) and yielded in order; cancelling the consumer cancels pending synthesis.
+    """
+    chunker = SentenceChunker()
+    pending = deque()  # (sentence, task) in spoken order
+    limit = asyncio.Semaphore(max_concurrency)
+
+    async def synthesize(sentence):
+        async with limit:
+            return await agenerate_tts(sentence, output_format)
+
+    try:
+        async for text in text_stream:
+            for sentence in chunker.feed(text):
+                pending.append((sentence, asyncio.create_task(synthesize(sentence))))
+            while pending and pending[0][1].done():
+                sentence, task = pending.popleft()
+                yield sentence, task.result()
+
+        remaining = chunker.flush()
+        if remaining:
+            pending.append((remaining, asyncio.create_task(synthesize(remaining))))
+        while pending:
+            sentence, task = pending.popleft()
+            yield sentence, await task
+    finally:
+        for _, task in pending:
+            task.cancel()
+
 if __name__ == "__main__":
     print("This is a module for TTS functionality.")
     # text = "Hello, I am your voice assistant. How can I help you today?"
@@ -0,0 +1,159 @@
+"""
+Compact encoding of tool results before they go back to the LLM.
+
+A raw Calendar event resource carries etag, creator, organizer, iCalUID,
+reminders, links and more, none of which the agent needs to answer the user.
+Every tool result stays in the agent's memory and is resent with each later LLM
+call, so its size is paid again on every call until it is summarized away.
+
+Results are projected to the fields that matter and written one item per line
+under a small header naming the columns. Each tool has a token budget; a result
+over budget keeps as many leading lines as fit and ends with an "N more" marker
+telling the model how to narrow the request.
+
+Token counts here are estimated at four characters per token, which is close to
+the tokenizer for this kind of text and keeps the tools free of tokenizer state.
+Set TOOL_RESULT_FORMAT=raw to get the old str() output back, e.g. to compare.
+"""
+
+import os
+import threading
+
+from event_cache import event_bounds
+
+TOOL_RESULT_FORMAT = os.getenv("TOOL_RESULT_FORMAT", "compact")  # "compact" or "raw"
+DEFAULT_TOKEN_BUDGET = 800
+TOOL_TOKEN_BUDGETS = {
+    "get_events_between_start_and_end": 600,
+    "find_event_by_name": 250,
+    "get_free_availability": 300,
+}
+
+_stats_lock = threading.Lock()
+stats = {"results": 0, "truncated": 0, "raw_tokens": 0, "encoded_tokens": 0}
+
+
+def estimate_tokens(text):
+    """Approximate token count of a string (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def token_budget(tool_name):
+    return TOOL_TOKEN_BUDGETS.get(tool_name, DEFAULT_TOKEN_BUDGET)
+
+
+def _finish(tool_name, encoded, raw, truncated=False):
+    """Records how much the encoding saved and returns the text to hand the LLM."""
+    raw_tokens, encoded_tokens = estimate_tokens(raw), estimate_tokens(encoded)
+    with _stats_lock:
+        stats["results"] += 1
+        stats["truncated"] += int(truncated)
+        stats["raw_tokens"] += raw_tokens
+        stats["encoded_tokens"] += encoded_tokens
+    return raw if TOOL_RESULT_FORMAT == "raw" else encoded
+
+
+def reset_stats():
+    with _stats_lock:
+        for key in stats:
+            stats[key] = 0
+
+
+def fit_lines(header, lines, budget, more_hint=""):
+    """
+    Joins header and lines, dropping trailing lines that don't fit in budget
+    tokens and appending "... N more" in their place. Returns (text, truncated).
+    """
+    used = estimate_tokens(header) + 1
+    kept = []
+    for i, line in enumerate(lines):
+        cost = estimate_tokens(line) + 1
+        remaining = len(lines) - i
+        # Leave room for the marker unless this is the last line
+        marker_cost = 0 if remaining == 1 else estimate_tokens(f"... {remaining - 1} more{more_hint}") + 1
+        if used + cost + marker_cost > budget:
+            kept.append(f"... {remaining} more{more_hint}")
+            return "\n".join([header] + kept), True
+        kept.append(line)
+        used += cost
+    return "\n".join([header] + kept), False
+
+
+# --- Calendar events ---
+
+def _format_time(event, tz):
+    """'2030-06-03 09:30-10:00', or '2030-06-04 (all day)' for all-day events."""
+    start, end = (bound.astimezone(tz) for bound in event_bounds(event, tz))
+    if "date" in event["start"]:
+        return f"{start:%Y-%m-%d} (all day)"
+    if start.date() == end.date():
+        return f"{start:%Y-%m-%d %H:%M}-{end:%H:%M}"
+    return f"{start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}"
+
+
+def format_event(event, tz):
+    """One event as a single line: time | title, plus location, attendees and recurrence when set."""
+    parts = [_format_time(event, tz), event.get("summary") or "(no title)"]
+    if event.get("location"):
+        parts.append(f"at {event['location']}")
+    attendees = [a.get("email") for a in event.get("attendees") or [] if a.get("email") and not a.get("self")]
+    if attendees:
+        parts.append("with " + ", ".join(attendees))
+    if event.get("recurringEventId") or event.get("recurrence"):
+        parts.append("recurring")
+    return " | ".join(parts)
+
+
+def encode_events(tool_name, events, tz, empty_message):
+    """The events list for the LLM: a count header, then one line per event."""
+    legacy = str([
+        {
+            "start_time": e["start"].get("dateTime", e["start"].get("date")),
+            "end_time": e["end"].get("dateTime", e["end"].get("date")),
+            "summary": e.get("summary"),
+        }
+        for e in events
+    ])
+    if not events:
+        return _finish(tool_name, empty_message, legacy)
+    header = f"{len(events)} event{'s' if len(events) != 1 else ''} (time | title | details), times in {tz.zone}:"
+    text, truncated = fit_lines(
+        header, [format_event(e, tz) for e in events], token_budget(tool_name),
+        " (ask for a shorter time range to see them)",
+    )
+    return _finish(tool_name, text, legacy, truncated)
+
+
+def encode_event(tool_name, event, tz, alternatives=()):
+    """
+    An event the LLM looked up, with its id so later calls can skip the lookup,
+    then other close matches, then its description clipped to the budget.
+    """
+    text = f"Found: {format_event(event, tz)} | event_id {event['id']}"
+    if alternatives:
+        text += "\nOther matches: " + "; ".join(f"{format_event(e, tz)} | event_id {e['id']}" for e in alternatives)
+    description = " ".join((event.get("description") or "").split())
+    room = token_budget(tool_name) - estimate_tokens(text) - 4
+    if description and room > 8:
+        if estimate_tokens(description) > room:
+            description = description[:room * 4].rsplit(" ", 1)[0] + " ..."
+        text += f"\nDescription: {description}"
+    return _finish(tool_name, text, f"found event {[event]}")
+
+
+# --- Batch mutations ---
+
+def encode_batch(tool_name, header, lines):
+    """Per-item outcomes of a batch tool, one line each; already compact, only budgeted."""
+    text, truncated = fit_lines(header, lines, token_budget(tool_name))
+    return _finish(tool_name, text, "\n".join([header] + lines), truncated)
+
+
+# --- Free time ---
+
+def encode_slots(tool_name, prefix, slots):
+    """Free slots as a comma-separated list, truncated with an "N more" marker."""
+    legacy = prefix + ", ".join(slots)
+    text, truncated = fit_lines(prefix.rstrip(": ") + ":", slots, token_budget(tool_name),
+                                " (ask for a shorter range to see them)")
+    return _finish(tool_name, text.replace("\n", " ", 1).replace("\n", ", "), legacy, truncated)
@@ -0,0 +1,150 @@
+"""
+Lightweight tracing for the voice turn pipeline.
+
+Stages (STT, LLM calls, tool calls and their Google API requests, summarization,
+TTS, audio delivery) are wrapped in spans. Each finished span's duration is kept
+in a per-name ring buffer so the app can show p50/p95/p99 latencies. When
+TRACE_EXPORT_PATH is set, finished spans are also appended to that JSON lines
+file as records shaped like OpenTelemetry spans (trace/span ids, parent id,
+start/end in unix nanoseconds, attributes, status); the file isn't rotated, so
+turn it on for debugging sessions rather than leaving it on in production.
+
+The current span lives in a contextvar, so nesting follows the call stack and
+carries into worker threads that run with a copied context.
+"""
+
+import contextvars
+import json
+import math
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Where finished spans are written, e.g. TRACE_EXPORT_PATH=traces.jsonl; off when empty
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_STATS_WINDOW = int(os.getenv("TRACE_STATS_WINDOW", "500"))  # durations kept per span name
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_durations = defaultdict(lambda: deque(maxlen=TRACE_STATS_WINDOW))  # name -> recent durations (ms)
+_stats_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+class Span:
+    """One timed operation. Use span() or start_span() rather than creating these directly."""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Adds attributes to the span."""
+        self.attributes.update(attributes)
+
+    def elapsed_ms(self):
+        """Milliseconds since the span started."""
+        return (time.perf_counter() - self._started) * 1000
+
+    def end(self, error=None):
+        """Finishes the span and exports it. Only the first call has any effect."""
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = self.elapsed_ms()
+        # A generator closed early by its consumer was cancelled, not broken
+        if error is not None and not isinstance(error, GeneratorExit):
+            self.error = f"{type(error).__name__}: {error}"
+        _record(self)
+
+    def to_record(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.start_ns + int(self.duration_ms * 1e6),
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+            "thread": threading.current_thread().name,
+        }
+
+
+def start_span(name, **attributes):
+    """
+    Starts a span under the current one without making it current. Call end()
+    when done; useful inside generators, where a context manager would leak
+    the span into the consumer's context between yields.
+    """
+    return Span(name, _current_span.get(), attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Times the enclosed block as a child of the current span."""
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def _record(finished):
+    with _stats_lock:
+        _durations[finished.name].append(finished.duration_ms)
+    if not TRACE_EXPORT_PATH:
+        return
+    line = json.dumps(finished.to_record(), default=str)
+    try:
+        with _export_lock, open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"Could not export span {finished.name}: {e}")
+
+
+def record_duration(name, duration_ms):
+    """Adds a duration measured outside any span (e.g. time spent queueing) to the stage stats."""
+    with _stats_lock:
+        _durations[name].append(duration_ms)
+
+
+def _percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    return sorted_values[max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)]
+
+
+def trace_stats():
+    """Returns [{stage, count, p50_ms, p95_ms, p99_ms}] over the recent window, by stage name."""
+    with _stats_lock:
+        snapshot = {name: sorted(values) for name, values in _durations.items() if values}
+    return [
+        {
+            "stage": name,
+            "count": len(values),
+            "p50_ms": round(_percentile(values, 50), 1),
+            "p95_ms": round(_percentile(values, 95), 1),
+            "p99_ms": round(_percentile(values, 99), 1),
+        }
+        for name, values in sorted(snapshot.items())
+    ]
+
+
+def reset_trace_stats():
+    """Forgets all recorded durations (the export file is left alone)."""
+    with _stats_lock:
+        _durations.clear()
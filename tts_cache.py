@@ -0,0 +1,140 @@
+"""
+Content-addressed cache for synthesized speech.
+
+Many replies are repeated word for word (greetings, confirmations, error
+messages), so audio is cached under a hash of the normalized text and every
+setting that affects the output. Lookups hit a small in-memory LRU first and
+then an on-disk tier that is trimmed (oldest first) to stay under a size budget.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", ".tts_cache")
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(16 * 1024 * 1024)))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+
+
+def normalize_text(text):
+    """Normalizes text so trivially different strings share one cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def tts_cache_key(text, voice_id, model_id, output_format, voice_settings):
+    """Returns the content address of one synthesis request."""
+    payload = json.dumps(
+        [normalize_text(text), voice_id, model_id, output_format, voice_settings],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Two-tier (memory LRU + size-bounded disk) audio cache."""
+
+    def __init__(self, directory=TTS_CACHE_DIR, memory_bytes=TTS_CACHE_MEMORY_BYTES, disk_bytes=TTS_CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()  # key -> audio bytes
+        self._memory_size = 0
+        self._disk_size = None  # computed lazily on first write
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def _remember(self, key, audio):
+        """Puts audio in the memory tier, evicting least recently used entries."""
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        if len(audio) > self.memory_bytes:
+            return
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get(self, key):
+        """Returns cached audio or None."""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return audio
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # mark as recently used for disk eviction
+        except OSError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self.stats["disk_hits"] += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        """Stores audio in both tiers."""
+        with self._lock:
+            self._remember(key, audio)
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write TTS cache entry: {e}")
+            return
+
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = self._scan_disk_size()
+            else:
+                self._disk_size += len(audio)
+            if self._disk_size > self.disk_bytes:
+                self._evict_disk()
+
+    def _entries(self):
+        """Returns (mtime, size, path) for every entry on disk."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".audio"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_disk_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict_disk(self):
+        """Deletes the least recently used files until the disk tier fits its budget."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_size = total
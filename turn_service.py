@@ -0,0 +1,272 @@
+"""
+Background turn-processing service.
+
+Voice turns used to run synchronously inside the Streamlit script thread, so a
+slow Gemini call tied up that session's rerun and every I/O wait held a
+thread. Turns are now submitted to one asyncio event loop running in a
+background thread, which drives STT, the agent (via the LLM's ainvoke/astream)
+and TTS on async clients, so waiting on the network costs no thread at all.
+
+- Each user has a lane: a bounded queue processed in order by one worker, so a
+  user's turns never overlap and their agent is never used concurrently.
+- Backpressure: a full lane, or too many queued turns overall, rejects the
+  submission with TurnQueueFull instead of piling up work.
+- A global semaphore caps how many turns run at once.
+- cancel(user_id) stops the running turn and drops queued ones, e.g. when the
+  user starts a new recording mid-turn.
+
+Progress is reported through a thread-safe queue of (kind, payload) events on
+the Turn handle, which the Streamlit script polls.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import span
+
+TURN_QUEUE_PER_USER = int(os.getenv("TURN_QUEUE_PER_USER", "2"))  # turns waiting per user
+TURN_QUEUE_TOTAL = int(os.getenv("TURN_QUEUE_TOTAL", "256"))  # turns waiting across all users
+TURN_MAX_CONCURRENT = int(os.getenv("TURN_MAX_CONCURRENT", "64"))  # turns running at once
+TURN_TIMEOUT_SECONDS = float(os.getenv("TURN_TIMEOUT_SECONDS", "120"))
+# Threads for the work that stays blocking: Calendar API calls (googleapiclient), audio preprocessing
+TURN_BLOCKING_WORKERS = int(os.getenv("TURN_BLOCKING_WORKERS", "32"))
+LANE_IDLE_SECONDS = 5 * 60  # an idle user's worker exits after this long
+
+
+class TurnQueueFull(Exception):
+    """Raised by submit() when the user's lane or the whole service is at capacity."""
+
+
+class Turn:
+    """Handle for one submitted turn. Events arrive on a thread-safe queue."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.events = queue.Queue()
+        self.submitted_at = time.monotonic()
+        self.finished = threading.Event()
+        self._task = None  # asyncio.Task once running
+        self._cancelled = False
+
+    def emit(self, kind, payload=None):
+        """Reports progress to the submitter (called from the service loop)."""
+        self.events.put((kind, payload))
+
+    def next_event(self, timeout=None):
+        """Returns the next (kind, payload) event, or None if none arrived within timeout."""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+
+class _Lane:
+    """One user's queue and the worker task draining it."""
+
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.worker = None
+        self.current = None  # Turn being processed
+
+
+class TurnService:
+    """Runs turn handlers on a private event loop; see the module docstring."""
+
+    def __init__(self, per_user=TURN_QUEUE_PER_USER, total=TURN_QUEUE_TOTAL,
+                 max_concurrent=TURN_MAX_CONCURRENT, timeout=TURN_TIMEOUT_SECONDS,
+                 blocking_workers=TURN_BLOCKING_WORKERS):
+        self.per_user = per_user
+        self.total = total
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        # asyncio.to_thread() uses the loop's default executor
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="turn-io"))
+        self._lanes = {}  # user_id -> _Lane, only touched on the loop
+        self._queued = 0
+        self._running = 0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0, "timed_out": 0}
+        self._thread = threading.Thread(target=self._run_loop, name="turn-service", daemon=True)
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _call(self, coro):
+        """Runs a coroutine on the service loop and waits for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    # --- Public API (thread-safe) ---
+
+    def submit(self, user_id, handler, *args):
+        """
+        Queues handler(turn, *args), an async function, on user_id's lane and
+        returns the Turn handle. Raises TurnQueueFull if there is no room.
+        """
+        turn = Turn(user_id)
+        self._call(self._enqueue(turn, handler, args))
+        return turn
+
+    def cancel(self, user_id):
+        """Cancels user_id's running turn and drops their queued ones. Returns how many were affected."""
+        return self._call(self._cancel(user_id))
+
+    def snapshot(self):
+        """Current load: lanes, queued and running turns, plus lifetime counters."""
+        return {"lanes": len(self._lanes), "queued": self._queued, "running": self._running, **self.stats}
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    # --- Event loop side ---
+
+    async def _enqueue(self, turn, handler, args):
+        lane = self._lanes.get(turn.user_id)
+        if lane is None:
+            lane = self._lanes[turn.user_id] = _Lane(self.per_user)
+        if self._queued >= self.total or lane.queue.full():
+            self.stats["rejected"] += 1
+            raise TurnQueueFull(
+                "Too many requests are waiting; please try again in a moment."
+                if self._queued >= self.total else
+                "Still working on your previous requests."
+            )
+        lane.queue.put_nowait((turn, handler, args))
+        self._queued += 1
+        self.stats["submitted"] += 1
+        if lane.worker is None or lane.worker.done():
+            lane.worker = asyncio.create_task(self._drain(turn.user_id, lane))
+
+    async def _drain(self, user_id, lane):
+        """Processes one user's turns in order; exits when the lane stays idle."""
+        while True:
+            try:
+                turn, handler, args = await asyncio.wait_for(lane.queue.get(), LANE_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                if lane.queue.empty() and self._lanes.get(user_id) is lane:
+                    del self._lanes[user_id]
+                return
+            self._queued -= 1
+            if turn.cancelled:
+                continue
+            lane.current = turn
+            try:
+                await self._run(turn, handler, args)
+            finally:
+                lane.current = None
+
+    async def _run(self, turn, handler, args):
+        async with self._semaphore:
+            if turn.cancelled:
+                # Cancelled while waiting for a free slot
+                turn.emit("cancelled")
+                turn.emit("done")
+                turn.finished.set()
+                return
+            self._running += 1
+            try:
+                queued_ms = round((time.monotonic() - turn.submitted_at) * 1000, 1)
+                with span("turn_service.turn", user_id=turn.user_id, queued_ms=queued_ms):
+                    # Created inside the span so the handler's spans nest under it
+                    turn._task = asyncio.create_task(handler(turn, *args))
+                    await asyncio.wait_for(turn._task, self.timeout)
+                self.stats["completed"] += 1
+            except asyncio.CancelledError:
+                self.stats["cancelled"] += 1
+                turn.emit("cancelled")
+            except asyncio.TimeoutError:
+                self.stats["timed_out"] += 1
+                turn.emit("error", TimeoutError(f"The turn took longer than {self.timeout:.0f}s"))
+            except Exception as e:
+                self.stats["failed"] += 1
+                turn.emit("error", e)
+            finally:
+                self._running -= 1
+                turn.emit("done")
+                turn.finished.set()
+
+    async def _cancel(self, user_id):
+        lane = self._lanes.get(user_id)
+        if lane is None:
+            return 0
+        affected = 0
+        while not lane.queue.empty():
+            turn, _, _ = lane.queue.get_nowait()
+            self._queued -= 1
+            turn._cancelled = True
+            turn.emit("cancelled")
+            turn.emit("done")
+            turn.finished.set()
+            self.stats["cancelled"] += 1
+            affected += 1
+        current = lane.current
+        if current is not None and not current.cancelled:
+            current._cancelled = True
+            if current._task is not None:
+                current._task.cancel()
+            affected += 1
+        return affected
+
+
+# --- Voice turn handler ---
+
+async def _cleaned(chunks):
+    from text_to_speech import clean_text
+
+    async for chunk in chunks:
+        yield clean_text(chunk)
+
+
+async def process_voice_turn(turn, user_id, audio_bytes, creds, output_format, stream=True,
+                             calendar_service=None, agents=None):
+    """
+    One voice turn for the service: trims and transcribes the recording, runs
+    the user's agent, and synthesizes the reply. Emits "transcript", then
+    "audio" (sentence, bytes) per spoken chunk, then "reply" with the full text;
+    "no_speech" if the recording held no speech. calendar_service and agents
+    (anything with get(user_id), default agent_pool) let benchmarks plug in fakes.
+    """
+    from agent import agent_pool
+    from audio_preprocessing import preprocess_audio
+    from calenderTool import calendar_session
+    from speech_to_text import atranscribe_audio
+    from text_to_speech import agenerate_tts, astream_tts, clean_text
+
+    with span("voice_turn", user_id=user_id, mode="service"), calendar_session(creds, calendar_service):
+        try:
+            with span("audio.preprocess", audio_bytes=len(audio_bytes)):
+                speech_bytes, audio_stats = await asyncio.to_thread(preprocess_audio, audio_bytes)
+        except Exception as e:
+            print(f"Audio preprocessing failed, sending the raw recording: {e}")
+            speech_bytes = audio_bytes
+        if speech_bytes is None:
+            turn.emit("no_speech")
+            return
+
+        transcript = await atranscribe_audio(speech_bytes)
+        if not transcript:
+            turn.emit("no_speech")
+            return
+        turn.emit("transcript", transcript)
+
+        # Building a new agent does blocking I/O, so keep it off the loop
+        session_agent = await asyncio.to_thread((agents or agent_pool).get, user_id)
+        if stream:
+            spoken = []
+            async for sentence, audio in astream_tts(_cleaned(session_agent.astream(transcript)), output_format):
+                turn.emit("audio", (sentence, audio))
+                spoken.append(sentence)
+            reply = " ".join(spoken)
+        else:
+            reply = clean_text(await session_agent.ainvoke(transcript))
+            turn.emit("audio", (reply, await agenerate_tts(reply, output_format)))
+        turn.emit("reply", reply)